@@ -0,0 +1,101 @@
+# 파서 백엔드 벤치마크 (네트워크 없이 저장된 HTML로 측정)
+#
+#   python bench/bench_parser.py                  # fixtures/*.html 측정
+#   python bench/bench_parser.py --repeat 200
+#   python bench/bench_parser.py --save URL NAME  # 실제 페이지를 fixtures/NAME.html로 저장
+#
+# 파일명이 listing*로 시작하면 목록, 그 외는 본문 페이지로 파싱한다.
+# article_crlf/nested_block/script/xml_decl은 lxml 결과가 bs4와 달라지는 페이지 (CRLF 줄바꿈,
+# <p> 안의 블록 요소, 본문 안의 <script>/<style>, XML 인코딩 선언) - 모두 일치해야 lxml을 기본값으로 쓸 수 있음
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(script_dir))
+
+import parsers
+
+FIXTURE_DIR = os.path.join(script_dir, "fixtures")
+
+def parse_page(kind, html, backend):
+    if kind == 'listing':
+        return parsers.parse_articles(html, backend)
+    return parsers.parse_content(html, backend)
+
+def measure(kind, html, backend, repeat):
+    # 파싱 시간 (ms/페이지)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse_page(kind, html, backend)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    # 최대 메모리 (한 페이지 파싱 중 Python 할당 최대치, lxml 내부 C 메모리는 제외)
+    tracemalloc.start()
+    parse_page(kind, html, backend)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed_ms, peak / 1024
+
+def available_backends():
+    return [b for b in parsers.BACKENDS if b != 'lxml' or parsers.lxml is not None]
+
+def run(repeat):
+    fixtures = sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.html")))
+    if not fixtures:
+        raise FileNotFoundError(f"HTML 파일이 없습니다: {FIXTURE_DIR}")
+
+    backends = available_backends()
+    print(f"{'fixture':<28}{'backend':<8}{'ms/page':>10}{'peak KiB':>12}{'speedup':>10}")
+    mismatches = 0
+
+    for path in fixtures:
+        name = os.path.basename(path)
+        kind = 'listing' if name.startswith('listing') else 'article'
+        with open(path, encoding='utf-8', newline='') as f:  # 받은 그대로 (CRLF 유지)
+            html = f.read()
+
+        # 모든 백엔드의 결과가 기준(bs4)과 같은지 확인
+        expected = parse_page(kind, html, 'bs4')
+        baseline_ms = None
+        for backend in backends:
+            try:
+                result = parse_page(kind, html, backend)
+            except Exception as e:
+                print(f"[불일치] {name}: {backend} 파싱 오류: {e}")
+                mismatches += 1
+                continue
+            if result != expected:
+                print(f"[불일치] {name}: {backend} 결과가 bs4와 다릅니다.")
+                mismatches += 1
+            elapsed_ms, peak_kib = measure(kind, html, backend, repeat)
+            baseline_ms = baseline_ms or elapsed_ms
+            print(f"{name:<28}{backend:<8}{elapsed_ms:>10.3f}{peak_kib:>12.1f}{baseline_ms / elapsed_ms:>9.1f}x")
+
+    return mismatches
+
+def save_fixture(url, name):
+    import requests
+    from fake_useragent import UserAgent
+
+    response = requests.get(url, headers={'User-Agent': UserAgent().random}, timeout=10)
+    response.raise_for_status()
+    path = os.path.join(FIXTURE_DIR, f"{name}.html")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(response.text)
+    print(f"저장 완료: {path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="파서 백엔드 벤치마크")
+    parser.add_argument('--repeat', type=int, default=50, help="페이지당 반복 횟수")
+    parser.add_argument('--save', nargs=2, metavar=('URL', 'NAME'), help="페이지를 fixture로 저장")
+    args = parser.parse_args()
+
+    if args.save:
+        save_fixture(*args.save)
+    else:
+        sys.exit(1 if run(args.repeat) else 0)
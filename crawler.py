@@ -4,15 +4,49 @@ from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
 import time
-import re
+import threading
+import functools
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
 from fake_useragent import UserAgent
-import pandas as pd
 import os
+import sqlite3
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+import store
+import parsers
+import metrics
+
+try:
+    import psutil  # 선택 사항: 드라이버 메모리 사용량 확인용
+except ImportError:
+    psutil = None
+
+# 본문 동시 수집 설정
+FETCH_WORKERS = 4       # 동시 요청 수 (1이면 드라이버로 순차 수집)
+FETCH_RATE_LIMIT = 2.0  # 호스트별 초당 최대 요청 수
+
+# 저장 조건: 좋아요 20개 이상, 내용 200자 이상
+MIN_LIKES = 20
+MIN_CONTENT_LENGTH = 200
+
+SEEN_DB = "teamblind_seen.db"  # 수집한 글 인덱스
+
+# 드라이버 풀 설정
+DRIVER_POOL_SIZE = 1
+DRIVER_MAX_PAGES = 200     # 이 페이지 수를 넘기면 드라이버 재시작
+DRIVER_MAX_RSS_MB = 1500   # 브라우저 메모리가 이 크기를 넘으면 재시작 (psutil 필요)
+
+_listing_validators = {}  # 목록 URL별 ETag/Last-Modified
+
+@functools.lru_cache(maxsize=None)
+def resolve_driver_path():
+    """chromedriver 경로 (프로세스당 한 번만 설치/조회)"""
+    return ChromeDriverManager().install()
 
 def setup_driver():
     ua = UserAgent()
@@ -43,7 +77,7 @@ def setup_driver():
     try:
         driver = webdriver.Chrome(
             service=Service(
-                ChromeDriverManager().install(),
+                resolve_driver_path(),
                 connect_timeout=30,
                 keep_alive=True
             ),
@@ -58,45 +92,112 @@ def setup_driver():
 
     return driver
 
-def parse_articles(html):
-    soup = BeautifulSoup(html, 'html.parser')
-    articles = []
-    
-    for item in soup.select('div.topic-list.best div.article'):
-        topic = item.select_one('span.topic a').text.strip()
-        
-        title_tag = item.select_one('a.tit')
-        title = title_tag.text.strip()
-        link = title_tag.get('href')
-        if link and not link.startswith('http'):
-            link = 'https://www.teamblind.com' + link
-        
-        has_image = 'ico-img' in title_tag['class'] if title_tag.has_attr('class') else False
-        has_poll = 'ico-poll' in title_tag['class'] if title_tag.has_attr('class') else False
-        
-        like = int(re.search(r'\d+', item.select_one('span.like').text).group())
-        comment = int(re.search(r'\d+', item.select_one('a.cmt').text).group())
-        
-        articles.append({
-            'topic': topic,
-            'title': title,
-            'link' : link,
-            'content': "",
-            'has_image': has_image,
-            'has_poll': has_poll,
-            'like': like,
-            'comment': comment
-        })
-    
-    return articles
+def load_page(driver, url):
+    driver.get(url)
+    driver.pages_loaded = getattr(driver, 'pages_loaded', 0) + 1
+
+class DriverPool:
+    """크롤링 주기 간 재사용하는 Chrome 드라이버 풀"""
+    def __init__(self, size=DRIVER_POOL_SIZE, max_pages=DRIVER_MAX_PAGES, max_rss_mb=DRIVER_MAX_RSS_MB):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @contextmanager
+    def driver(self):
+        if self._closed:
+            raise RuntimeError("이미 종료된 드라이버 풀입니다.")
+        self._slots.acquire()
+        driver = None
+        try:
+            driver = self._acquire()
+            yield driver
+        finally:
+            if driver is not None:
+                self._release(driver)
+            self._slots.release()
+
+    def shutdown(self):
+        self._closed = True
+        with self._lock:
+            drivers, self._idle = self._idle, []
+        for driver in drivers:
+            self._quit(driver)
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                driver = self._idle.pop() if self._idle else None
+            if driver is None:
+                return setup_driver()
+            if self._is_healthy(driver):
+                return driver
+            print("응답 없는 드라이버 교체")
+            self._quit(driver)
+
+    def _release(self, driver):
+        reason = None
+        if self._closed:
+            reason = "풀 종료"
+        elif getattr(driver, 'pages_loaded', 0) >= self.max_pages:
+            reason = f"{driver.pages_loaded}페이지 처리"
+        elif not self._is_healthy(driver):
+            reason = "응답 없음"
+        else:
+            rss_mb = self._rss_mb(driver)
+            if rss_mb > self.max_rss_mb:
+                reason = f"메모리 {rss_mb:.0f}MB"
+
+        if reason:
+            print(f"드라이버 종료 ({reason})")
+            self._quit(driver)
+        else:
+            with self._lock:
+                self._idle.append(driver)
+
+    @staticmethod
+    def _is_healthy(driver):
+        try:
+            return driver.execute_script("return 1;") == 1
+        except Exception:
+            return False
+
+    @staticmethod
+    def _rss_mb(driver):
+        """chromedriver와 하위 브라우저 프로세스의 메모리 합계 (MB)"""
+        if psutil is None:
+            return 0.0
+        try:
+            root = psutil.Process(driver.service.process.pid)
+            processes = [root] + root.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / (1024 * 1024)
+        except Exception:
+            return 0.0
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Error quitting driver: {e}")
+
+def parse_articles(html, backend=None):
+    return parsers.parse_articles(html, backend)
+
+def parse_content_html(html, backend=None):
+    return parsers.parse_content(html, backend)
 
 def parse_article_content(driver, url):
     try:
-        driver.get(url)
+        load_page(driver, url)
         time.sleep(2)
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        
-        content = soup.select_one('p.contents-txt#contentArea').text.strip()
+        content = parse_content_html(driver.page_source)
+        if content is None:
+            raise ValueError("본문 영역을 찾을 수 없습니다")
         
         return {
             'content': content,
@@ -105,56 +206,249 @@ def parse_article_content(driver, url):
         print(f"Error parsing {url}: {str(e)}")
         return None
 
+def build_session(pool_size=10):
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=1)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = UserAgent().random
+    return session
+
+class HostRateLimiter:
+    """호스트별 요청 간격 제한 (스레드 안전)"""
+    def __init__(self, rate=FETCH_RATE_LIMIT):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+def fetch_article_content_http(session, url, timeout=10):
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    content = parse_content_html(response.text)
+    if content is None:
+        return None
+    return {
+        'content': content,
+    }
 
-def crawl_teamblind(url):
-    driver = setup_driver()
+def fetch_article_contents(links, driver=None, workers=FETCH_WORKERS, rate_limit=FETCH_RATE_LIMIT, session=None):
+    """글 본문 수집 - {링크: 본문} 반환 (실패한 링크는 포함하지 않음)"""
+    results = {}
+
+    if workers > 1 and links:
+        session = session or build_session(workers)
+        limiter = HostRateLimiter(rate_limit)
+
+        def fetch(link):
+            limiter.wait(link)
+            try:
+                return link, fetch_article_content_http(session, link)
+            except Exception as e:
+                print(f"Error fetching {link}: {str(e)}")
+                return link, None
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for link, article_data in executor.map(fetch, links):
+                if article_data:
+                    results[link] = article_data['content']
+        print(f"HTTP 동시 수집: {len(results)}/{len(links)}개 성공")
+
+    # HTTP로 얻지 못한 본문은 드라이버로 순차 수집
+    if driver is not None:
+        for link in links:
+            if link in results:
+                continue
+            print(f"Processing: {link}")
+            article_data = parse_article_content(driver, link)
+            if article_data:
+                results[link] = article_data['content']
+            time.sleep(1)
+
+    return results
+
+class SeenIndex:
+    """수집한 글 인덱스 (링크별 좋아요/댓글 수, 본문 수집 여부)"""
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen_articles (
+                link TEXT PRIMARY KEY,
+                like_count INTEGER NOT NULL,
+                comment_count INTEGER NOT NULL,
+                fetched INTEGER NOT NULL DEFAULT 0,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def fetched_links(self, links):
+        """이미 본문을 수집한 링크 집합"""
+        links = list(links)
+        fetched = set()
+        # SQLite 변수 개수 제한을 넘지 않도록 나눠서 조회
+        for i in range(0, len(links), 500):
+            chunk = links[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT link FROM seen_articles WHERE fetched = 1 AND link IN ({placeholders})",
+                chunk
+            )
+            fetched.update(row[0] for row in rows)
+        return fetched
+
+    def select_for_fetch(self, articles, min_likes=MIN_LIKES):
+        """본문 수집이 필요한 글만 선택 (처음 조건을 만족했거나 좋아요 수가 기준을 넘은 글)"""
+        fetched = self.fetched_links(article['link'] for article in articles)
+        return [
+            article for article in articles
+            if article['link'] not in fetched and article['like'] >= min_likes
+        ]
+
+    def update(self, articles, fetched_links=()):
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        fetched_links = set(fetched_links)
+        self.conn.executemany("""
+            INSERT INTO seen_articles (link, like_count, comment_count, fetched, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(link) DO UPDATE SET
+                like_count = excluded.like_count,
+                comment_count = excluded.comment_count,
+                fetched = MAX(fetched, excluded.fetched),
+                last_seen = excluded.last_seen
+        """, [
+            (article['link'], article['like'], article['comment'],
+             int(article['link'] in fetched_links), now, now)
+            for article in articles
+        ])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def crawl_teamblind(url, workers=FETCH_WORKERS, rate_limit=FETCH_RATE_LIMIT, seen_index=None, min_likes=MIN_LIKES, pool=None):
+    # 풀을 넘겨받지 않으면 이번 호출에서만 쓰고 종료
+    own_pool = pool is None
+    if own_pool:
+        pool = DriverPool()
+    
+    try:
+        with metrics.stage('crawl') as m:
+            articles = _crawl_with_retries(url, pool, workers, rate_limit, seen_index, min_likes)
+            m['articles'] = len(articles)
+        return articles
+    finally:
+        if own_pool:
+            pool.shutdown()
+
+def fetch_listing_http(session, url, timeout=10):
+    """목록 페이지 조건부 요청 (이전 ETag/Last-Modified 사용, 변경 없으면 304)"""
+    headers = {}
+    validators = _listing_validators.get(url, {})
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return session.get(url, headers=headers, timeout=timeout)
+
+def remember_listing_validators(url, response):
+    # 처리가 끝난 뒤에만 저장해야 실패한 주기를 304로 건너뛰지 않음
+    _listing_validators[url] = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+
+def forget_listing_validators(url):
+    # 목록을 브라우저로 읽으면 HTML 껍데기의 ETag는 글 목록 변화와 무관하므로 조건부 요청을 하지 않음
+    _listing_validators.pop(url, None)
+
+def load_listing_with_driver(pool, url):
+    with pool.driver() as driver:
+        # 페이지 접속
+        load_page(driver, url)
+        
+        # 명시적 대기 강화
+        WebDriverWait(driver, 30).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "div.topic-list.best")))
+        
+        # 스크롤 처리
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight*0.8);")
+        time.sleep(1)
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        
+        # 추가 데이터 로딩 대기
+        WebDriverWait(driver, 20).until(
+            EC.presence_of_all_elements_located((By.CSS_SELECTOR, "div.article"))
+        )
+        
+        # 기존 파싱 로직
+        return parse_articles(driver.page_source)
+
+def _crawl_with_retries(url, pool, workers, rate_limit, seen_index, min_likes):
     retry_count = 0
     max_retries = 3
     
     while retry_count < max_retries:
         try:
-            # 네트워크 연결 확인
-            session = requests.Session()
-            retry = Retry(total=3, backoff_factor=1)
-            adapter = HTTPAdapter(max_retries=retry)
-            session.mount('http://', adapter)
-            session.mount('https://', adapter)
-            
-            if not session.get(url, timeout=10).ok:
+            session = build_session(max(workers, 1))
+            
+            response = fetch_listing_http(session, url)
+            if response.status_code == 304:
+                print("목록 페이지 변경 없음 - 이번 주기는 건너뜁니다.")
+                return []
+            if not response.ok:
                 raise ConnectionError("Failed to establish connection")
 
-            # 페이지 접속
-            driver.get(url)
-            
-            # 명시적 대기 강화
-            WebDriverWait(driver, 30).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "div.topic-list.best")))
-            
-            # 스크롤 처리
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight*0.8);")
-            time.sleep(1)
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            # 서버 렌더링 HTML에 목록이 있으면 바로 파싱하고, 없을 때만 브라우저 사용
+            articles = parse_articles(response.text)
+            static_listing = bool(articles)
+            if static_listing:
+                print(f"정적 HTML에서 글 {len(articles)}개 파싱 (브라우저 생략)")
+            else:
+                forget_listing_validators(url)
+                articles = load_listing_with_driver(pool, url)
             
-            # 추가 데이터 로딩 대기
-            WebDriverWait(driver, 20).until(
-                EC.presence_of_all_elements_located((By.CSS_SELECTOR, "div.article"))
-            )
+            # 이미 수집한 글은 건너뜀
+            targets = articles
+            if seen_index is not None:
+                targets = seen_index.select_for_fetch(articles, min_likes)
+                print(f"본문 수집 대상: {len(targets)}/{len(articles)}개 (나머지는 이미 수집했거나 조건 미달)")
+            links = [article['link'] for article in targets]
             
-            # 기존 파싱 로직
-            articles = parse_articles(driver.page_source)
+            # 링크 기준으로 본문 병합 (수집 실패 시에도 순서가 어긋나지 않음)
+            contents = fetch_article_contents(links, workers=workers, rate_limit=rate_limit, session=session)
+            missing = [link for link in links if link not in contents]
+            if missing:
+                with pool.driver() as driver:
+                    contents.update(fetch_article_contents(missing, driver=driver, workers=1))
             
-            results = []
             for article in articles:
-                print(f"Processing: {article['link']}")
-                article_data = parse_article_content(driver, article['link'])
-                if article_data:
-                    results.append(article_data)
+                if article['link'] in contents:
+                    article['content'] = contents[article['link']]
                     article['crawl_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # 타임스탬프 추가
-                time.sleep(1)
-
-            for idx, article in enumerate(results):
-                articles[idx]['content'] = article['content']
             
+            if seen_index is not None:
+                seen_index.update(articles, fetched_links=contents.keys())
+            
+            # 본문을 하나라도 못 가져왔으면 다음 주기에 304로 건너뛰지 않도록 검증값을 저장하지 않음
+            # (브라우저로 읽은 목록은 HTML 응답이 목록을 담고 있지 않으므로 저장하지 않음)
+            still_missing = [link for link in links if link not in contents]
+            if still_missing:
+                print(f"본문 수집 실패 {len(still_missing)}개 - 다음 주기에 목록을 다시 받습니다.")
+            elif static_listing:
+                remember_listing_validators(url, response)
             return articles
             
         except Exception as e:
@@ -167,53 +461,48 @@ def crawl_teamblind(url):
 
 
 if __name__ == "__main__":
-    import time
-    from datetime import datetime
-    
     CRAWL_INTERVAL = 300  
     
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    seen_index = SeenIndex(os.path.join(script_dir, SEEN_DB))
+    driver_pool = DriverPool()  # 주기마다 브라우저를 새로 띄우지 않도록 재사용
+    conn = store.connect()
+    store.import_legacy(conn)
+    
     try:
         while True:
             print(f"\n{'='*50}")
             print(f"크롤링 시작 시간: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
             
-            articles = crawl_teamblind("https://www.teamblind.com/kr/")
+            articles = crawl_teamblind("https://www.teamblind.com/kr/", seen_index=seen_index, pool=driver_pool)
             
             # # 타임스탬프 추가
             # for article in articles:
             #     article['crawl_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             
-            # 조건 필터링: 좋아요 10개 이상, 내용 200자 이상
+            # 조건 필터링: 좋아요 20개 이상, 내용 200자 이상
             filtered_articles = [
                 article for article in articles 
-                if article['like'] >= 20 and len(article.get('content', '')) >= 200
+                if article['like'] >= MIN_LIKES and len(article.get('content', '')) >= MIN_CONTENT_LENGTH
             ]
             
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            output_path = os.path.join(script_dir, "teamblind_articles.xlsx")
-            
-            if os.path.exists(output_path):
-                existing_df = pd.read_excel(output_path, engine='openpyxl')
-                new_df = pd.DataFrame(filtered_articles)
-                combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-            else:
-                combined_df = pd.DataFrame(filtered_articles)
-            
-            combined_df.drop_duplicates(subset=['link'], keep='first', inplace=True)
-            #combined_df.sort_values(by='crawl_time', ascending=False, inplace=True)
-            # 수정 코드 (컬럼 존재 확인)
-            if 'crawl_time' in combined_df.columns:
-                combined_df.sort_values(by='crawl_time', ascending=False, inplace=True)
-            else:
-                print("Warning: crawl_time column not found")
+            # 새 글만 저장소에 추가 (기존 글 전체를 다시 쓰지 않음)
+            added = store.add_articles(conn, filtered_articles)
+            total = store.count_articles(conn)
             
-            combined_df.to_excel(output_path, index=False, engine='openpyxl')
+            if store.EXPORT_EXCEL:
+                store.export_excel(conn, os.path.join(script_dir, "teamblind_articles.xlsx"))
             
-            print(f"\n✅ 조건에 맞는 새로운 글 {len(filtered_articles)}개 처리 완료")
-            print(f"📄 총 저장 글 수: {len(combined_df)}개")
+            print(f"\n✅ 조건에 맞는 새로운 글 {added}개 처리 완료")
+            print(f"📄 총 저장 글 수: {total}개")
+            metrics.export()
             print(f"⏰ 다음 크롤링 예정: {datetime.fromtimestamp(time.time() + CRAWL_INTERVAL).strftime('%Y-%m-%d %H:%M:%S')}")
             
             time.sleep(CRAWL_INTERVAL)
             
     except KeyboardInterrupt:
-        print("\n\n🛑 사용자에 의해 프로그램이 종료되었습니다.")
\ No newline at end of file
+        print("\n\n🛑 사용자에 의해 프로그램이 종료되었습니다.")
+    finally:
+        driver_pool.shutdown()
+        seen_index.close()
+        conn.close()
\ No newline at end of file
@@ -0,0 +1,143 @@
+# 생성 결과 캐시와 유사 글(재업로드/약간 수정한 글) 탐지
+# - 생성 캐시: 정규화한 본문 + 프롬프트 템플릿 + 생성 설정의 해시를 키로 저장
+# - 유사 글: 글자 5-gram MinHash 서명을 LSH 밴드 버킷으로 색인 (SQLite 인덱스 조회)
+import hashlib
+import json
+import re
+import unicodedata
+import zlib
+from datetime import datetime
+import numpy as np
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+BANDS = 16                      # 16밴드 x 8행: 유사도 약 0.7부터 후보로 잡힘
+ROWS = NUM_PERM // BANDS
+SIMILARITY_THRESHOLD = 0.8      # 추정 자카드 유사도가 이 이상이면 중복
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = np.random.RandomState(20240101)  # 서명이 실행마다 같도록 고정 시드
+_PERM_A = _rng.randint(1, 2**31 - 1, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, 2**31 - 1, size=NUM_PERM).astype(np.uint64)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generation_cache (
+    cache_key TEXT PRIMARY KEY,
+    generated_text TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS minhash_signatures (
+    article_id INTEGER PRIMARY KEY,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS minhash_buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    article_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_minhash_buckets ON minhash_buckets(band, bucket);
+CREATE INDEX IF NOT EXISTS idx_minhash_buckets_article ON minhash_buckets(article_id);
+"""
+
+def init(conn):
+    """캐시/색인 테이블 생성 (store.connect 후 한 번 호출)"""
+    conn.executescript(SCHEMA)
+
+def normalize_content(text):
+    """유니코드 정규화, 소문자화, 공백 정리"""
+    text = unicodedata.normalize('NFKC', str(text)).lower()
+    return re.sub(r'\s+', ' ', text).strip()
+
+# --- 생성 캐시 ---
+
+def generation_key(content, prompt_template, settings):
+    payload = json.dumps(
+        [normalize_content(content), prompt_template, settings],
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def get_generation(conn, key):
+    row = conn.execute(
+        "SELECT generated_text FROM generation_cache WHERE cache_key = ?", (key,)
+    ).fetchone()
+    return row[0] if row else None
+
+def put_generation(conn, key, generated_text):
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO generation_cache (cache_key, generated_text, created_at) VALUES (?, ?, ?)",
+            (key, generated_text, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        )
+
+# --- MinHash 유사 글 색인 ---
+
+def _shingles(text):
+    # 공백/문장부호를 지운 글자 n-gram (한국어는 단어보다 글자 단위가 안정적)
+    text = re.sub(r'[\W_]+', '', normalize_content(text))
+    if len(text) < SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def signature(text):
+    shingles = _shingles(text)
+    if not shingles:
+        return None
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode('utf-8')) for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME
+    return (permuted.min(axis=0) & 0xFFFFFFFF).astype(np.uint32)
+
+def _band_buckets(sig):
+    for band in range(BANDS):
+        digest = hashlib.blake2b(sig[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8).digest()
+        yield band, int.from_bytes(digest, 'big', signed=True)
+
+def similarity(sig_a, sig_b):
+    """두 서명의 추정 자카드 유사도"""
+    return float(np.mean(sig_a == sig_b))
+
+def find_near_duplicate(conn, article_id, content, threshold=SIMILARITY_THRESHOLD, accept=None):
+    """색인된 다른 글 중 가장 비슷한 글 id (threshold 미만이면 None, accept(id)가 False인 글은 제외)"""
+    sig = signature(content)
+    if sig is None:
+        return None
+
+    buckets = list(_band_buckets(sig))
+    conditions = ' OR '.join(['(band = ? AND bucket = ?)'] * len(buckets))
+    params = [value for pair in buckets for value in pair]
+    rows = conn.execute(f"""
+        SELECT article_id, signature FROM minhash_signatures
+        WHERE article_id != ? AND article_id IN (
+            SELECT article_id FROM minhash_buckets WHERE {conditions}
+        )
+    """, [int(article_id)] + params).fetchall()
+
+    scored = [
+        (similarity(sig, np.frombuffer(blob, dtype=np.uint32)), candidate_id)
+        for candidate_id, blob in rows
+    ]
+    for score, candidate_id in sorted(scored, reverse=True):
+        if score < threshold:
+            break
+        if accept is None or accept(candidate_id):
+            return candidate_id
+    return None
+
+def index_article(conn, article_id, content):
+    sig = signature(content)
+    if sig is None:
+        return
+    article_id = int(article_id)
+    with conn:
+        conn.execute("DELETE FROM minhash_buckets WHERE article_id = ?", (article_id,))
+        conn.execute(
+            "INSERT OR REPLACE INTO minhash_signatures (article_id, signature) VALUES (?, ?)",
+            (article_id, sig.tobytes())
+        )
+        conn.executemany(
+            "INSERT INTO minhash_buckets (band, bucket, article_id) VALUES (?, ?, ?)",
+            [(band, bucket, article_id) for band, bucket in _band_buckets(sig)]
+        )
@@ -3,43 +3,65 @@ from llama_cpp import Llama
 import pandas as pd
 import time
 import os
+import json
+import argparse
+from collections import Counter
 from pprint import pprint
+import store
+import dedup
+import metrics
 
-# 1. 엑셀 파일에서 컨텐츠 불러오기
-def load_contents():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    excel_path = os.path.join(script_dir, "teamblind_articles.xlsx")
-    
-    if not os.path.exists(excel_path):
-        raise FileNotFoundError("엑셀 파일을 찾을 수 없습니다. 먼저 크롤링을 실행해주세요.")
-    
-    df = pd.read_excel(excel_path, engine='openpyxl')
-    
-    # 신규 글 필터링 (generated_text가 없는 행)
-    if 'generated_text' not in df.columns:
-        df['generated_text'] = None
-    
-    return df[df['generated_text'].isnull()]
+USE_PREFIX_CACHE = True  # 시스템 프롬프트 KV 상태 재사용
+
+GENERATION_PARAMS = dict(
+    max_tokens=2048,
+    temperature=0.82,
+    top_p=0.97,
+    repeat_penalty=1.05,
+    mirostat_mode=0
+)
+
+# 스트리밍 생성 설정
+USE_STREAMING = True
+TARGET_MAX_CHARS = 1200          # 이 길이를 넘긴 뒤 문장이 끝나면 생성 중단
+SENTENCE_ENDINGS = ('.', '!', '?', '…', '~')
+DEGENERATE_WINDOW = 40           # 반복 검사 구간 (글자 수)
+DEGENERATE_REPEATS = 3           # 같은 구간이 이만큼 나오면 반복으로 판단
+MAX_GENERATION_RETRIES = 2       # 반복 출력 시 재시도 횟수
+
+USE_DEDUP = True  # 유사 글 생성 생략 + 같은 입력 생성 결과 재사용
+MODEL_REPO = "heegyu/EEVE-Korean-Instruct-10.8B-v1.0-GGUF"
+MODEL_FILE = "ggml-model-Q4_K_M.gguf"
+
+# 생성 결과를 한 건씩 먼저 기록하는 체크포인트 (추가 전용 JSONL, 시작할 때 복구 후 비움)
+CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_checkpoint.jsonl")
+RECOVERING_PATH = CHECKPOINT_PATH + ".recovering"  # 복구 중인 체크포인트 (복구 도중 종료되면 다음 실행에서 다시 읽음)
+STALE_RUNNING_SECONDS = 600  # running 상태로 이보다 오래 멈춘 글은 다시 대기열로
+
+# 1. 저장소에서 컨텐츠 불러오기
+def load_contents(conn):
+    # 신규 글 필터링 (LLM 단계 대기 중인 행)
+    return store.pending(conn, 'llm')
 
 # 2. 모델 초기화
 def initialize_model():
-    model_name_or_path = "heegyu/EEVE-Korean-Instruct-10.8B-v1.0-GGUF"
-    model_basename = "ggml-model-Q4_K_M.gguf"
-    model_path = hf_hub_download(repo_id=model_name_or_path, filename=model_basename)
-
-    return Llama(
-        model_path=model_path,
-        n_threads=8,
-        n_batch=2048,
-        n_gpu_layers=43,
-        n_ctx=4096,
-        main_gpu=0,
-        offload_kqv=False
-    )
+    model_path = hf_hub_download(repo_id=MODEL_REPO, filename=MODEL_FILE)
+
+    with metrics.stage('llm_model_load', model=MODEL_FILE):
+        return Llama(
+            model_path=model_path,
+            n_threads=8,
+            n_batch=2048,
+            n_gpu_layers=43,
+            n_ctx=4096,
+            main_gpu=0,
+            offload_kqv=False
+        )
 
 # 3. 프롬프트 생성
-def format_prompt(user_query):
-    return f"""<|im_start|>system
+# 시스템 프롬프트는 모든 글에 공통 - llama.cpp가 직전 프롬프트와 같은 앞부분을 재사용하고,
+# 그게 안 될 때만(직전 상태가 시스템 프롬프트로 시작하지 않을 때) 저장해 둔 KV 상태를 복원
+SYSTEM_PROMPT = """<|im_start|>system
 [글쓰기 전문가 지시사항]
 1. 반드시 1인칭 시점(나/저) 사용, 개인 경험담처럼 생생하게 서술
 2. 대화체, 감정이 실린 독백 포함
@@ -47,11 +69,63 @@ def format_prompt(user_query):
 4. 1인칭 시점으로 자연스럽게 이야기 형식으로 작성
 5. 사람들의 관심을 끌 후킹멘트로 시작해줘
 6. 반말로 작성해줘<|im_end|>
-<|im_start|>user
+"""
+
+def format_prompt(user_query):
+    return SYSTEM_PROMPT + f"""<|im_start|>user
 {user_query}<|im_end|>
 <|im_start|>assistant
 """
 
+def _common_prefix(cached, tokens):
+    # llama.cpp가 다시 평가하지 않는 앞부분 길이 (마지막 토큰은 항상 다시 평가)
+    length = 0
+    for cached_token, token in zip(cached, tokens[:-1]):
+        if cached_token != token:
+            break
+        length += 1
+    return length
+
+class PrefixCache:
+    """시스템 프롬프트를 한 번만 평가해 llama.cpp 상태를 저장하고,
+    llama.cpp 자체 앞부분 재사용보다 나을 때만 복원 (재사용 토큰은 자체 재사용과 나눠 집계)"""
+    def __init__(self, lcpp_llm, prefix=SYSTEM_PROMPT):
+        self.llm = lcpp_llm
+        self.tokens = lcpp_llm.tokenize(prefix.encode('utf-8'), add_bos=True, special=True)
+        lcpp_llm.reset()
+        lcpp_llm.eval(self.tokens)
+        self.state = lcpp_llm.save_state()
+        self.calls = 0
+        self.restores = 0
+        self.prompt_tokens = 0
+        self.builtin_tokens = 0  # llama.cpp가 직전 상태에서 스스로 재사용한 토큰
+        self.saved_tokens = 0    # 상태 복원으로 추가로 아낀 토큰
+
+    def restore(self, prompt):
+        """필요하면 저장한 상태를 복원 - 복원으로 추가로 아낀 토큰 수 반환"""
+        prompt_tokens = self.llm.tokenize(prompt.encode('utf-8'), add_bos=True, special=True)
+        builtin = _common_prefix(self.llm.input_ids, prompt_tokens)
+        cached = _common_prefix(self.tokens, prompt_tokens)
+        
+        saved = 0
+        if cached > builtin:
+            self.llm.load_state(self.state)
+            self.restores += 1
+            saved = cached - builtin
+        
+        self.calls += 1
+        self.prompt_tokens += len(prompt_tokens)
+        self.builtin_tokens += builtin
+        self.saved_tokens += saved
+        return saved
+
+    def report(self):
+        if not self.calls:
+            return "프롬프트 캐시: 사용 내역 없음"
+        ratio = self.saved_tokens / self.prompt_tokens * 100 if self.prompt_tokens else 0
+        return (f"프롬프트 캐시: {self.calls}건 중 {self.restores}건 복원, 추가 재사용 토큰 {self.saved_tokens}개 "
+                f"(프롬프트의 {ratio:.1f}%), llama.cpp 자체 재사용 {self.builtin_tokens}개")
+
 # def format_prompt(user_query):
 #     return f"""<|im_start|>system
 # [글쓰기 전문가 지시사항]
@@ -72,52 +146,270 @@ def postprocess(text):
         return "생성 실패: 충분한 길이의 응답이 생성되지 않았습니다."
     return processed
 
-# 5. 메인 처리 함수
-def process_contents():
-    df = load_contents()
+# 5. 스트리밍 생성 (토큰이 도착할 때마다 검사하고 조기 종료)
+def is_degenerate(text, window=DEGENERATE_WINDOW, repeats=DEGENERATE_REPEATS):
+    """마지막 window 글자가 repeats번 이상 나오면 반복 출력으로 판단"""
+    if len(text) < window * repeats:
+        return False
+    return text.count(text[-window:]) >= repeats
+
+def stream_generate(lcpp_llm, prompt):
+    """생성 텍스트와 종료 사유(end/target_length/repetition/length) 반환"""
+    stream = lcpp_llm(prompt=prompt, stream=True, stop=["<|im_end|>"], **GENERATION_PARAMS)
+    text = ""
+    reason = "length"
+    try:
+        for chunk in stream:
+            choice = chunk['choices'][0]
+            text += choice['text']
+            
+            if "<|im_end|>" in text or choice.get('finish_reason') == 'stop':
+                reason = "end"
+                break
+            # 목표 길이를 넘긴 뒤 문장이 끝나면 중단
+            if len(text) >= TARGET_MAX_CHARS and text.rstrip().endswith(SENTENCE_ENDINGS):
+                reason = "target_length"
+                break
+            if is_degenerate(text):
+                reason = "repetition"
+                break
+    finally:
+        stream.close()
+    return text, reason
+
+# 6. 한 건 생성 후 저장
+def generate_text(lcpp_llm, content, prefix_cache=None):
+    """생성 결과와 단계 상태 반환"""
+    if pd.isna(content) or len(content.strip()) < 50:
+        return store.SKIPPED, "콘텐츠 부족"
+    
+    prompt = format_prompt(content)
+    
+    with metrics.stage('llm_generate', streaming=USE_STREAMING) as m:
+        text = _generate(lcpp_llm, prompt, prefix_cache)
+        if text is None:
+            return store.FAILED, "생성 실패: 반복 출력이 계속 감지되었습니다."
+        m['tokens'] = len(lcpp_llm.tokenize(text.encode('utf-8'), add_bos=False))
+    
+    result = postprocess(text)
+    status = store.FAILED if result.startswith("생성 실패") else store.DONE
+    return status, result
+
+def _generate(lcpp_llm, prompt, prefix_cache=None):
+    # 반복 출력으로 재시도를 모두 써버리면 None
+    if USE_STREAMING:
+        for attempt in range(1, MAX_GENERATION_RETRIES + 2):
+            if prefix_cache is not None:
+                prefix_cache.restore(prompt)
+            text, reason = stream_generate(lcpp_llm, prompt)
+            if reason != "repetition":
+                break
+            print(f"반복 출력 감지 - 중단 후 재시도 ({attempt}/{MAX_GENERATION_RETRIES + 1})")
+        else:
+            return None
+    else:
+        if prefix_cache is not None:
+            prefix_cache.restore(prompt)
+        response = lcpp_llm(prompt=prompt, **GENERATION_PARAMS)
+        text = response['choices'][0]['text']
+    return text
+
+def generation_cache_key(content):
+    # 본문, 프롬프트 템플릿, 모델과 생성 설정이 모두 같아야 같은 키
+    settings = dict(
+        GENERATION_PARAMS,
+        model=f"{MODEL_REPO}/{MODEL_FILE}",
+        streaming=USE_STREAMING,
+        target_max_chars=TARGET_MAX_CHARS
+    )
+    return dedup.generation_key(content, format_prompt(''), settings)
+
+def write_checkpoint(idx, status, result, processing_time=None):
+    record = {
+        'id': int(idx),
+        'status': status,
+        'generated_text': result,
+        'processing_time': processing_time,
+        'time': store.now()
+    }
+    with open(CHECKPOINT_PATH, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+def save_result(conn, idx, status, result, processing_time=None):
+    # 체크포인트에 먼저 기록한 뒤 저장소 갱신 (저장소 쓰기 전에 죽어도 다음 실행에서 복구)
+    write_checkpoint(idx, status, result, processing_time)
+    fields = {'generated_text': result}
+    if processing_time is not None:
+        fields['processing_time'] = processing_time
+    store.update_stage(conn, idx, 'llm', status, **fields)
+
+def recover_checkpoints(conn):
+    """체크포인트에만 남은 결과를 저장소에 반영하고, 멈춘 작업을 다시 대기열에 넣음"""
+    restored = 0
+    # 파일을 옮겨 놓고 읽음 (그동안 다른 작업자가 쓰는 기록은 새 체크포인트 파일에 쌓임)
+    if os.path.exists(CHECKPOINT_PATH) and not os.path.exists(RECOVERING_PATH):
+        os.replace(CHECKPOINT_PATH, RECOVERING_PATH)
+    try:
+        with open(RECOVERING_PATH, encoding='utf-8') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        lines = []
+    
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue  # 기록 중 종료된 마지막 줄
+        # 기록 이후 저장소가 갱신되지 않은 글만 반영 (수동으로 다시 대기열에 넣은 글은 제외)
+        status, updated_at = store.stage_state(conn, record['id'], 'llm')
+        if status in (store.PENDING, store.RUNNING) and record['time'] >= (updated_at or ''):
+            fields = {'generated_text': record['generated_text']}
+            if record.get('processing_time') is not None:
+                fields['processing_time'] = record['processing_time']
+            store.update_stage(conn, record['id'], 'llm', record['status'], **fields)
+            restored += 1
+    
+    # 모두 저장소에 반영됐으므로 삭제 (체크포인트가 계속 커지지 않도록)
+    if lines:
+        try:
+            os.remove(RECOVERING_PATH)
+        except FileNotFoundError:
+            pass  # 동시에 시작한 다른 작업자가 먼저 삭제
+    
+    requeued = store.requeue_stale(conn, 'llm', STALE_RUNNING_SECONDS)
+    if restored or requeued:
+        print(f"체크포인트 복구: 결과 {restored}건 반영, 중단된 작업 {requeued}건 재대기")
+
+def throughput_report(statuses, elapsed):
+    """실행 성공 여부와 관계없이 시간당 유효 결과(done) 수"""
+    counts = Counter(statuses)
+    useful = counts.get(store.DONE, 0)
+    per_hour = useful / elapsed * 3600 if elapsed > 0 else 0.0
+    detail = ', '.join(f"{status} {count}" for status, count in sorted(counts.items()))
+    return f"유효 결과 {useful}/{len(statuses)}건 ({detail}), 시간당 {per_hour:.1f}건"
+
+def is_live_original(conn, article_id):
+    # 생성이 끝났거나 진행 중인 글만 원글로 인정
+    status, _ = store.stage_state(conn, article_id, 'llm')
+    return status in (store.DONE, store.PENDING, store.RUNNING)
+
+def process_row(conn, lcpp_llm, idx, content, prefix_cache=None):
+    with metrics.stage('llm', article_id=int(idx)) as m:
+        m['status'] = _process_row(conn, lcpp_llm, idx, content, prefix_cache)
+    return m['status']
+
+def _process_row(conn, lcpp_llm, idx, content, prefix_cache=None):
+    try:
+        start_time = time.time()
+        
+        cache_key = None
+        if USE_DEDUP and not pd.isna(content):
+            # 재업로드(똑같은 글 포함)/약간 수정한 글은 생성하지 않음 (원글이 생성 실패/건너뜀이면 이 글로 다시 생성)
+            duplicate_of = dedup.find_near_duplicate(conn, idx, content, accept=lambda other: is_live_original(conn, other))
+            if duplicate_of is not None:
+                print(f"[{idx}] 유사 글 #{duplicate_of}이(가) 있어 생성을 건너뜁니다.")
+                save_result(conn, idx, store.DUPLICATE, f"중복 글: #{duplicate_of}")
+                return store.DUPLICATE
+            dedup.index_article(conn, idx, content)
+            
+            # 살아 있는 원글이 없을 때만 같은 입력의 생성 결과를 그대로 사용 (원글 실패, 같은 글 재생성 등)
+            cache_key = generation_cache_key(content)
+            cached = dedup.get_generation(conn, cache_key)
+            if cached is not None:
+                print(f"[{idx}] 같은 입력의 생성 결과 재사용")
+                save_result(conn, idx, store.DONE, cached, time.time() - start_time)
+                return store.DONE
+        
+        status, result = generate_text(lcpp_llm, content, prefix_cache)
+        
+        # 행 단위로 바로 저장
+        save_result(conn, idx, status, result, time.time() - start_time)
+        if cache_key is not None and status == store.DONE:
+            dedup.put_generation(conn, cache_key, result)
+        print(f"소요 시간: {time.time() - start_time:.2f}s\n")
+        return status
+        
+    except Exception as e:
+        print(f"에러 발생: {str(e)}")
+        save_result(conn, idx, store.FAILED, f"처리 오류: {str(e)}")
+        return store.FAILED
+
+# 7. 메인 처리 함수 (대기 중인 글을 한 번 처리)
+def process_contents(lcpp_llm=None):
+    conn = store.connect()
+    store.import_legacy(conn)
+    dedup.init(conn)
+    recover_checkpoints(conn)
+    df = load_contents(conn)
     if df.empty:
         print("처리할 새로운 글이 없습니다.")
         return
     
-    lcpp_llm = initialize_model()
+    if lcpp_llm is None:
+        lcpp_llm = initialize_model()
+    prefix_cache = PrefixCache(lcpp_llm) if USE_PREFIX_CACHE else None
     
     total_start = time.time()
-    for idx, row in df.iterrows():
-        try:
-            start_time = time.time()
-            content = row['content']
-            
-            if pd.isna(content) or len(content.strip()) < 50:
-                df.at[idx, 'generated_text'] = "콘텐츠 부족"
-                continue
-            
-            response = lcpp_llm(
-                prompt=format_prompt(content),
-                max_tokens=2048,
-                temperature=0.82,
-                top_p=0.97,
-                repeat_penalty=1.05,
-                mirostat_mode=0
-            )
-            
-            result = postprocess(response['choices'][0]['text'])
-            df.at[idx, 'generated_text'] = result
-            df.at[idx, 'processing_time'] = time.time() - start_time
-            
-            print(f"처리 완료: {idx+1}/{len(df)}")
-            print(f"소요 시간: {time.time() - start_time:.2f}s\n")
-            
-        except Exception as e:
-            print(f"에러 발생: {str(e)}")
-            df.at[idx, 'generated_text'] = f"처리 오류: {str(e)}"
+    statuses = []
+    for position, (idx, row) in enumerate(df.iterrows(), 1):
+        statuses.append(process_row(conn, lcpp_llm, idx, row['content'], prefix_cache))
+        print(f"처리 완료: {position}/{len(df)}")
     
-    # 결과 저장
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    output_path = os.path.join(script_dir, "teamblind_articles_processed.xlsx")
-    df.to_excel(output_path, index=False, engine='openpyxl')
+    # 결과 보고서 (선택)
+    if store.EXPORT_EXCEL:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        output_path = os.path.join(script_dir, "teamblind_articles_processed.xlsx")
+        store.export_excel(conn, output_path)
     
     print(f"\n총 처리 시간: {time.time() - total_start:.2f}초")
     print(f"평균 처리 시간: {(time.time() - total_start)/len(df):.2f}초/건")
+    print(throughput_report(statuses, time.time() - total_start))
+    if prefix_cache is not None:
+        print(prefix_cache.report())
+    metrics.export()
+
+# 8. 상주 생성 작업자 (모델은 한 번만 로드하고 저장소 대기열을 계속 처리)
+def serve(poll_interval=30):
+    conn = store.connect()
+    store.import_legacy(conn)
+    dedup.init(conn)
+    recover_checkpoints(conn)
+    
+    load_start = time.time()
+    lcpp_llm = initialize_model()
+    prefix_cache = PrefixCache(lcpp_llm) if USE_PREFIX_CACHE else None
+    print(f"모델 로드 완료: {time.time() - load_start:.2f}초")
+    
+    statuses = []
+    serve_start = time.time()
+    try:
+        while True:
+            job = store.claim_next(conn, 'llm')
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            
+            print(f"[{job['id']}] 생성 시작: {job['title']}")
+            statuses.append(process_row(conn, lcpp_llm, job['id'], job['content'], prefix_cache))
+            print(throughput_report(statuses, time.time() - serve_start))
+            metrics.export()
+            
+    except KeyboardInterrupt:
+        print(f"\n작업자 종료 (처리 {len(statuses)}건)")
+        if prefix_cache is not None:
+            print(prefix_cache.report())
+    finally:
+        conn.close()
 
 if __name__ == "__main__":
-    process_contents()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="블라인드 글 LLM 각색")
+    parser.add_argument('--serve', action='store_true', help="모델을 상주시키고 대기열을 계속 처리")
+    parser.add_argument('--interval', type=int, default=30, help="대기열이 비었을 때 확인 간격(초)")
+    args = parser.parse_args()
+    
+    if args.serve:
+        serve(args.interval)
+    else:
+        process_contents()
\ No newline at end of file
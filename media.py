@@ -0,0 +1,88 @@
+# ffprobe 기반 미디어 정보 조회
+# - 파일마다 ffprobe JSON 호출 한 번으로 길이/해상도/코덱/fps를 읽음 (클립을 열지 않음)
+# - 결과는 저장소(SQLite)의 media_info 테이블에 경로 + 크기 + 수정 시각으로 캐시 (파일이 바뀌면 다시 조회)
+#   조회/저장은 경로 인덱스로 한 행만 읽고 써서 캐시가 커져도 비용이 같고, 여러 프로세스가 함께 써도 항목이 사라지지 않음
+import os
+import json
+import sqlite3
+import threading
+import subprocess
+from fractions import Fraction
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+CACHE_DB = os.path.join(script_dir, "blindtube.db")  # store.DB_PATH와 같은 파일
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_info (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    info TEXT NOT NULL
+);
+"""
+
+_local = threading.local()
+
+def _fps(rate):
+    if not rate or rate in ('0/0', '0/1'):
+        return 0.0
+    return float(Fraction(rate))
+
+def _ffprobe(path):
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe 실패: {os.path.basename(path)}: {result.stderr.strip()}")
+    info = json.loads(result.stdout)
+    streams = info.get('streams', [])
+    video = next((st for st in streams if st.get('codec_type') == 'video'), {})
+    audio = next((st for st in streams if st.get('codec_type') == 'audio'), {})
+    return {
+        'duration': float(info.get('format', {}).get('duration', 0)),
+        'width': int(video.get('width', 0)),
+        'height': int(video.get('height', 0)),
+        'video_codec': video.get('codec_name'),
+        'pix_fmt': video.get('pix_fmt'),
+        'fps': _fps(video.get('avg_frame_rate') or video.get('r_frame_rate')),
+        'audio_codec': audio.get('codec_name'),
+        'sample_rate': int(audio.get('sample_rate', 0)),
+    }
+
+def _connect(cache_db):
+    # SQLite 연결은 스레드마다 따로 (작업 프로세스로 fork된 뒤에는 새로 연결)
+    connections = getattr(_local, 'connections', None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    if cache_db not in connections:
+        conn = sqlite3.connect(cache_db, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        connections[cache_db] = conn
+    return connections[cache_db]
+
+def probe(path, cache_db=CACHE_DB):
+    """길이, 해상도, 비디오/오디오 코덱, 픽셀 포맷, fps, 샘플레이트 조회 (cache_db=None이면 캐시 안 함)"""
+    if cache_db is None:
+        return _ffprobe(path)
+
+    key = os.path.abspath(path)
+    stat = os.stat(path)
+    conn = _connect(cache_db)
+    row = conn.execute(
+        "SELECT info FROM media_info WHERE path = ? AND size = ? AND mtime_ns = ?",
+        (key, stat.st_size, stat.st_mtime_ns)
+    ).fetchone()
+    if row:
+        return json.loads(row[0])
+
+    info = _ffprobe(path)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO media_info (path, size, mtime_ns, info) VALUES (?, ?, ?, ?)",
+            (key, stat.st_size, stat.st_mtime_ns, json.dumps(info, ensure_ascii=False))
+        )
+    return info
@@ -0,0 +1,250 @@
+# 단계별 성능 지표 기록
+# - stage(): 한 건/한 단계의 벽시계 시간, CPU 시간(자식 프로세스 ffmpeg 포함),
+#   블록 실행 중 측정한 최대 RSS (psutil로 주기 측정, 자식 프로세스 합계 포함)
+# - 처리량: tokens → 초당 토큰, audio_seconds → 실시간 배율(RTF), frames → 인코딩 fps
+# - 모든 기록은 metrics.jsonl에 한 줄씩 추가, export()가 Prometheus textfile(metrics.prom)로 집계
+#   (집계 누적값과 읽은 위치를 metrics_state.json에 저장해 매번 새로 추가된 줄만 읽음)
+#
+#   python metrics.py   # 로그를 집계해 metrics.prom 갱신 후 요약 출력
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil  # 선택 사항: 블록별 메모리 측정용 (없으면 프로세스 최고치만 기록)
+except ImportError:
+    psutil = None
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+METRICS_LOG = os.path.join(script_dir, "metrics.jsonl")
+PROM_PATH = os.path.join(script_dir, "metrics.prom")
+STATE_PATH = os.path.join(script_dir, "metrics_state.json")  # 집계 누적값 + 로그에서 읽은 위치
+ENABLED = True
+PREFIX = "blindtube"
+RSS_SAMPLE_SECONDS = 0.1  # 블록 실행 중 메모리 측정 간격
+
+_lock = threading.Lock()
+
+def _maxrss_bytes(who):
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux는 KB 단위
+
+def process_max_rss_bytes():
+    """프로세스 시작 후 최고 메모리 사용량 (블록별 값이 아님, 알 수 없으면 None)"""
+    if resource is not None:
+        return _maxrss_bytes(resource.RUSAGE_SELF)
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', None)
+    return None
+
+def children_max_rss_bytes():
+    """종료된 자식 프로세스(ffmpeg 등) 중 가장 큰 최고 메모리 (프로세스 시작 후 누적 최고치)"""
+    if resource is None:
+        return None
+    return _maxrss_bytes(resource.RUSAGE_CHILDREN)
+
+class RssSampler(threading.Thread):
+    """블록이 실행되는 동안 자신과 자식 프로세스의 RSS를 주기적으로 측정해 최대값 보관
+    (자식은 이 프로세스의 모든 자식 합계라 다른 스레드가 띄운 ffmpeg도 포함됨)"""
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self.child_peak = 0
+        self._done = threading.Event()
+        self.sample()
+
+    def sample(self):
+        try:
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            children = 0
+            for child in self.process.children(recursive=True):
+                try:
+                    children += child.memory_info().rss
+                except psutil.Error:
+                    continue  # 측정 중 종료된 자식
+            self.child_peak = max(self.child_peak, children)
+        except psutil.Error:
+            pass
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.sample()
+
+def _child_cpu_seconds():
+    # 종료된 자식 프로세스(ffmpeg/ffprobe)의 CPU 시간
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def _derive(values):
+    wall = values.get('wall_seconds')
+    if not wall:
+        return
+    if values.get('tokens'):
+        values['tokens_per_second'] = round(values['tokens'] / wall, 2)
+    if values.get('audio_seconds'):
+        values['real_time_factor'] = round(wall / values['audio_seconds'], 4)
+    if values.get('frames'):
+        values['encode_fps'] = round(values['frames'] / wall, 2)
+    if values.get('bytes'):
+        values['bytes_per_second'] = round(values['bytes'] / wall, 1)
+
+def record(stage_name, **values):
+    """지표 한 건을 JSONL 로그에 추가"""
+    if not ENABLED:
+        return
+    _derive(values)
+    entry = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'stage': stage_name, 'pid': os.getpid()}
+    entry.update(values)
+    line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+    with _lock:
+        with open(METRICS_LOG, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+@contextmanager
+def stage(stage_name, **labels):
+    """with 블록의 소요 시간/CPU/메모리 기록 - 넘겨받은 dict에 tokens, audio_seconds, frames 등을 채우면 처리량도 계산
+    - thread_cpu_seconds: 이 블록을 실행한 스레드의 CPU 시간 (llama.cpp/torch 내부 스레드는 제외)
+    - process_cpu_seconds: 프로세스 전체 CPU 시간 (동시에 도는 다른 단계의 CPU도 포함)"""
+    values = dict(labels)
+    wall_start = time.perf_counter()
+    thread_cpu_start = time.thread_time()
+    cpu_start = time.process_time()
+    child_start = _child_cpu_seconds()
+    sampler = RssSampler() if psutil is not None and ENABLED else None
+    if sampler is not None:
+        sampler.start()
+    try:
+        yield values
+    except BaseException:
+        values['error'] = True
+        raise
+    finally:
+        values['wall_seconds'] = round(time.perf_counter() - wall_start, 4)
+        values['thread_cpu_seconds'] = round(time.thread_time() - thread_cpu_start, 4)
+        values['process_cpu_seconds'] = round(time.process_time() - cpu_start, 4)
+        values['child_cpu_seconds'] = round(_child_cpu_seconds() - child_start, 4)
+        if sampler is not None:
+            sampler.stop()
+            values['peak_rss_bytes'] = sampler.peak
+            values['child_peak_rss_bytes'] = sampler.child_peak
+        values['process_max_rss_bytes'] = process_max_rss_bytes()
+        values['children_max_rss_bytes'] = children_max_rss_bytes()
+        record(stage_name, **values)
+
+# --- Prometheus textfile ---
+
+_COUNTERS = ('wall_seconds', 'thread_cpu_seconds', 'process_cpu_seconds', 'child_cpu_seconds',
+             'tokens', 'audio_seconds', 'frames', 'bytes')
+_GAUGES = ('tokens_per_second', 'real_time_factor', 'encode_fps', 'bytes_per_second')
+_MEMORY = ('peak_rss_bytes', 'child_peak_rss_bytes', 'process_max_rss_bytes', 'children_max_rss_bytes')
+
+def _fold(totals, entry):
+    stats = totals.setdefault(entry['stage'], {'items': 0, 'errors': 0})
+    stats['items'] += 1
+    stats['errors'] += 1 if entry.get('error') else 0
+    for key in _COUNTERS:
+        if entry.get(key) is not None:
+            stats[key] = stats.get(key, 0) + entry[key]
+    for key in _GAUGES:
+        if entry.get(key) is not None:
+            stats[key] = entry[key]
+    for key in _MEMORY:
+        if entry.get(key):
+            stats[key] = max(stats.get(key, 0), entry[key])
+
+def _load_state(state_path, log_path, inode):
+    # 다른 로그이거나 로그가 교체/잘렸으면 처음부터 다시 집계
+    state = {'log': os.path.abspath(log_path), 'inode': inode, 'offset': 0, 'totals': {}}
+    if state_path is None or not os.path.exists(state_path):
+        return state
+    try:
+        with open(state_path, encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return state
+    if saved.get('log') == state['log'] and saved.get('inode') == inode:
+        return saved
+    return state
+
+def aggregate(log_path=METRICS_LOG, state_path=STATE_PATH):
+    """로그를 단계별로 합산 (카운터는 합계, 처리량은 마지막 값, 메모리는 최대값)
+    - 지난 집계 이후 추가된 줄만 읽어 state_path의 누적값에 더함 (state_path=None이면 처음부터)"""
+    try:
+        stat = os.stat(log_path)
+    except FileNotFoundError:
+        return {}
+    state = _load_state(state_path, log_path, stat.st_ino)
+    if stat.st_size < state['offset']:
+        state = _load_state(None, log_path, stat.st_ino)
+
+    with open(log_path, 'rb') as f:
+        f.seek(state['offset'])
+        data = f.read()
+    data = data[:data.rfind(b'\n') + 1]  # 아직 쓰는 중인 마지막 줄은 다음 집계에서
+    for line in data.splitlines():
+        try:
+            _fold(state['totals'], json.loads(line))
+        except (json.JSONDecodeError, UnicodeDecodeError, KeyError):
+            continue
+    state['offset'] += len(data)
+
+    if state_path is not None and data:
+        tmp_path = f"{state_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, state_path)
+    return state['totals']
+
+def export(log_path=METRICS_LOG, prom_path=PROM_PATH, state_path=STATE_PATH):
+    """node_exporter textfile 수집기가 읽을 수 있는 형식으로 저장 (원자적 교체)"""
+    if not ENABLED:
+        return None
+    totals = aggregate(log_path, state_path)
+    metrics = [('items', 'counter'), ('errors', 'counter')]
+    metrics += [(key, 'counter') for key in _COUNTERS]
+    metrics += [(key, 'gauge') for key in _GAUGES + _MEMORY]
+
+    lines = []
+    for key, kind in metrics:
+        name = f"{PREFIX}_stage_{key}_total" if kind == 'counter' else f"{PREFIX}_stage_{key}"
+        samples = [(stage_name, stats[key]) for stage_name, stats in sorted(totals.items()) if key in stats]
+        if not samples:
+            continue
+        lines.append(f"# TYPE {name} {kind}")
+        lines += [f'{name}{{stage="{stage_name}"}} {value}' for stage_name, value in samples]
+
+    tmp_path = f"{prom_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, prom_path)
+    return prom_path
+
+def summary(log_path=METRICS_LOG, state_path=STATE_PATH):
+    rows = []
+    for stage_name, stats in sorted(aggregate(log_path, state_path).items()):
+        average = stats.get('wall_seconds', 0) / stats['items']
+        rates = ', '.join(f"{key} {stats[key]}" for key in _GAUGES if key in stats)
+        rows.append(f"{stage_name:<22}{stats['items']:>6}건  실패 {stats['errors']:<4} 평균 {average:8.2f}초  {rates}")
+    return '\n'.join(rows) or "기록된 지표 없음"
+
+if __name__ == "__main__":
+    print(f"저장: {export()}")
+    print(summary())
@@ -0,0 +1,292 @@
+# 크롤링부터 업로드까지 글마다 바로 흘려보내는 파이프라인
+# crawl → llm → tts → video → sub → upload 단계를 크기 제한 큐로 잇고,
+# 단계마다 정해진 수의 작업자 스레드가 처리한다.
+# - 앞 단계가 끝난 글은 즉시 다음 단계 큐로 넘어감 (배치 전체를 기다리지 않음)
+# - 다음 큐가 가득 차면 넘기는 쪽이 기다림 (느린 단계 앞에 작업이 무한히 쌓이지 않음)
+# - 큐에 있는 글은 pending, 작업자가 꺼낼 때 running으로 기록
+# - 재시작하면 running으로 남은 글을 pending으로 되돌려 멈춘 단계부터 이어서 처리
+#
+#   python orchestrator.py
+#   python orchestrator.py --no-crawl   # 저장소에 쌓인 글만 처리
+import os
+import time
+import queue
+import random
+import argparse
+import threading
+from datetime import datetime
+import store
+import dedup
+import crawler
+import llm
+import voice
+import video
+import sub
+import youtube
+import metrics
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+TTS_FOLDER = os.path.join(script_dir, "blind_tts")
+MERGED_FOLDER = os.path.join(script_dir, "merged_videos")
+OUTPUT_FOLDER = youtube.UPLOAD_FOLDER
+BACKGROUND_FOLDER = os.path.join(script_dir, "background")
+
+CRAWL_URL = "https://www.teamblind.com/kr/"
+CRAWL_INTERVAL = 300
+SINGLE_PASS = True  # 배경 합성과 자막을 한 번에 인코딩 (video 단계가 sub까지 처리)
+
+# 단계별 동시 작업자 수 (모델을 올리는 단계는 1개)
+STAGE_WORKERS = {'llm': 1, 'tts': 1, 'video': 2, 'sub': 1, 'upload': 2}
+QUEUE_SIZE = 4  # 단계 앞에 대기할 수 있는 최대 글 수
+
+class Pipeline:
+    def __init__(self, stage_workers=STAGE_WORKERS, queue_size=QUEUE_SIZE, single_pass=SINGLE_PASS):
+        self.stage_workers = stage_workers
+        self.single_pass = single_pass
+        self.queues = {stage: queue.Queue(maxsize=queue_size) for stage in store.STAGES}
+        self.queued = {stage: set() for stage in store.STAGES}  # 큐에 들어 있는 글 id (중복 투입 방지)
+        self.stop = threading.Event()
+        self.threads = []
+        self.latencies = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.backgrounds = video.load_backgrounds(BACKGROUND_FOLDER)
+        self.quota = youtube.QuotaTracker()
+        self.service_factory = None
+
+    # --- 공용 ---
+
+    def conn(self):
+        # SQLite 연결은 스레드마다 따로
+        if not hasattr(self._local, 'conn'):
+            self._local.conn = store.connect()
+        return self._local.conn
+
+    def next_stage(self, stage):
+        if stage == 'video' and self.single_pass:
+            return 'upload'
+        index = store.STAGES.index(stage)
+        return store.STAGES[index + 1] if index + 1 < len(store.STAGES) else None
+
+    def submit(self, stage, job):
+        """단계 큐에 글을 넣음 (큐가 가득 차면 빌 때까지 대기, 상태는 pending 그대로)"""
+        with self._lock:
+            if job['id'] in self.queued[stage]:
+                return
+            self.queued[stage].add(job['id'])
+        while not self.stop.is_set():
+            try:
+                self.queues[stage].put(job, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def feed_backlog(self, stage):
+        """저장소에서 대기 중인 글을 큐에 채움"""
+        for article_id in store.pending(self.conn(), stage).index:
+            if self.stop.is_set():
+                return
+            self.submit(stage, store.get_article(self.conn(), article_id))
+
+    def worker(self, stage, handler):
+        while not self.stop.is_set():
+            try:
+                job = self.queues[stage].get(timeout=1)
+            except queue.Empty:
+                continue
+            with self._lock:
+                self.queued[stage].discard(job['id'])
+
+            # 꺼낼 때 running으로 (llm --serve 작업자 등이 먼저 가져갔으면 건너뜀)
+            if not store.claim(self.conn(), job['id'], stage):
+                continue
+
+            start = time.time()
+            try:
+                ok = handler(job)
+            except Exception as e:
+                print(f"[{stage}] [{job['id']}] 오류: {str(e)}")
+                store.update_stage(self.conn(), job['id'], stage, store.FAILED)
+                ok = False
+            print(f"[{stage}] [{job['id']}] {'완료' if ok else '중단'} ({time.time() - start:.1f}초)")
+
+            next_stage = self.next_stage(stage)
+            if ok and next_stage:
+                self.submit(next_stage, store.get_article(self.conn(), job['id']))
+
+    # --- 단계별 처리 ---
+
+    def crawl_loop(self, interval=CRAWL_INTERVAL):
+        seen_index = crawler.SeenIndex(os.path.join(script_dir, crawler.SEEN_DB))
+        pool = crawler.DriverPool()
+        conn = self.conn()
+        try:
+            while not self.stop.is_set():
+                articles = crawler.crawl_teamblind(CRAWL_URL, seen_index=seen_index, pool=pool)
+                filtered = [
+                    article for article in articles
+                    if article['like'] >= crawler.MIN_LIKES
+                    and len(article.get('content', '')) >= crawler.MIN_CONTENT_LENGTH
+                ]
+                added = store.add_articles(conn, filtered)
+                print(f"[crawl] 새 글 {added}개")
+                self.feed_backlog('llm')
+                self.stop.wait(interval)
+        finally:
+            pool.shutdown()
+            seen_index.close()
+
+    def run_llm(self):
+        conn = self.conn()
+        dedup.init(conn)
+        lcpp_llm = llm.initialize_model()
+        prefix_cache = llm.PrefixCache(lcpp_llm) if llm.USE_PREFIX_CACHE else None
+
+        def handle(job):
+            return llm.process_row(conn, lcpp_llm, job['id'], job['content'], prefix_cache) == store.DONE
+        self.worker('llm', handle)
+
+    def run_tts(self):
+        engine = voice.get_engine()
+        os.makedirs(TTS_FOLDER, exist_ok=True)
+
+        def handle(job):
+            text = voice.preprocess_text(str(job['generated_text']))
+            if len(text.strip()) < 10:
+                store.update_stage(self.conn(), job['id'], 'tts', store.SKIPPED)
+                return False
+            filename = f"{job['id']:03d}_{voice.sanitize_filename(str(job['title']))}.mp3"
+            audio_path = os.path.join(TTS_FOLDER, filename)
+            voice.synthesize_article(engine, text, audio_path)
+            store.update_stage(self.conn(), job['id'], 'tts', store.DONE, audio_path=audio_path)
+            return True
+        self.worker('tts', handle)
+
+    def run_video(self):
+        os.makedirs(MERGED_FOLDER, exist_ok=True)
+        os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+        threads = video.plan_workers(self.stage_workers['video'])[1]
+
+        def handle(job):
+            audio_path = job['audio_path']
+            base_name = os.path.splitext(os.path.basename(audio_path))[0]
+            background = random.choice(self.backgrounds)
+
+            if self.single_pass:
+                output_path = sub.render_audio(audio_path, background, OUTPUT_FOLDER, TTS_FOLDER, threads=threads)
+                store.update_stage(self.conn(), job['id'], 'video', store.DONE, video_path=output_path)
+                store.update_stage(self.conn(), job['id'], 'sub', store.DONE, output_path=output_path)
+                return True
+
+            video_path = os.path.join(MERGED_FOLDER, f"{base_name}.mp4")
+            if not video.merge_audio_video(background, audio_path, video_path, threads=threads):
+                store.update_stage(self.conn(), job['id'], 'video', store.FAILED)
+                return False
+            store.update_stage(self.conn(), job['id'], 'video', store.DONE, video_path=video_path)
+            return True
+        self.worker('video', handle)
+
+    def run_sub(self):
+        def handle(job):
+            output_path = sub.process_video(job['video_path'], OUTPUT_FOLDER, TTS_FOLDER)
+            store.update_stage(self.conn(), job['id'], 'sub', store.DONE, output_path=output_path)
+            return True
+        self.worker('sub', handle)
+
+    def run_upload(self):
+        youtube_service = self.service_factory()
+
+        def handle(job):
+            video_path = job['output_path']
+            youtube.validate_shorts(video_path)
+            title, description = youtube.make_metadata(os.path.basename(video_path))
+
+            while True:
+                self.quota.reserve(youtube.UPLOAD_COST)
+                try:
+                    video_id = youtube.upload_short(youtube_service, video_path, title, description)
+                    break
+                except youtube.QuotaExceeded:
+                    self.quota.exhaust()
+
+            store.update_stage(self.conn(), job['id'], 'upload', store.DONE, video_id=video_id)
+            youtube.move_uploaded_file(os.path.basename(video_path))
+            self.record_latency(job)
+            return True
+        self.worker('upload', handle)
+
+    # --- 실행 ---
+
+    def record_latency(self, job):
+        if not job.get('crawl_time'):
+            return
+        crawled = datetime.strptime(str(job['crawl_time']), '%Y-%m-%d %H:%M:%S')
+        latency = (datetime.now() - crawled).total_seconds()
+        with self._lock:
+            self.latencies.append(latency)
+        metrics.record('publish_latency', article_id=job['id'], wall_seconds=round(latency, 1))
+        print(f"[upload] [{job['id']}] 게시까지 {latency / 60:.1f}분 (크롤링 시각 기준)")
+
+    def latency_report(self):
+        if not self.latencies:
+            return "업로드된 글 없음"
+        ordered = sorted(self.latencies)
+        median = ordered[len(ordered) // 2]
+        return (f"업로드 {len(ordered)}건, 크롤링→게시 중앙값 {median / 60:.1f}분, "
+                f"최소 {ordered[0] / 60:.1f}분, 최대 {ordered[-1] / 60:.1f}분")
+
+    def start(self, crawl=True):
+        conn = self.conn()
+        store.import_legacy(conn)
+        dedup.init(conn)
+        llm.recover_checkpoints(conn)
+        # 이전 실행이 처리 중에 멈춘 글을 다시 대기열로
+        # (llm은 --serve 작업자와 나눠 쓸 수 있으므로 오래 멈춘 글만, 나머지 단계는 이 프로세스만 처리)
+        store.requeue_stale(conn, 'llm', llm.STALE_RUNNING_SECONDS)
+        for stage in store.STAGES[1:]:
+            store.requeue_running(conn, stage)
+        self.service_factory = youtube.make_service_factory()
+
+        runners = {
+            'llm': self.run_llm, 'tts': self.run_tts, 'video': self.run_video,
+            'sub': self.run_sub, 'upload': self.run_upload,
+        }
+        for stage, runner in runners.items():
+            for i in range(self.stage_workers.get(stage, 1)):
+                self._spawn(f"{stage}-{i}", runner)
+        for stage in store.STAGES:
+            self._spawn(f"backlog-{stage}", self.feed_backlog, stage)
+        if crawl:
+            self._spawn("crawl", self.crawl_loop)
+
+    def _spawn(self, name, target, *args):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def shutdown(self):
+        self.stop.set()
+        for thread in self.threads:
+            thread.join(timeout=5)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="블라인드 글 → 쇼츠 스트리밍 파이프라인")
+    parser.add_argument('--no-crawl', action='store_true', help="크롤링 없이 저장소의 대기 글만 처리")
+    parser.add_argument('--two-pass', action='store_true', help="merged_videos를 거쳐 자막을 따로 입힘")
+    args = parser.parse_args()
+
+    pipeline = Pipeline(single_pass=not args.two_pass)
+    pipeline.start(crawl=not args.no_crawl)
+    try:
+        while True:
+            time.sleep(60)
+            depths = ', '.join(f"{stage} {q.qsize()}" for stage, q in pipeline.queues.items())
+            print(f"[상태] 큐: {depths} | {pipeline.latency_report()}")
+            metrics.export()
+    except KeyboardInterrupt:
+        print("\n🛑 종료 중... (처리 중이던 글은 다음 실행에서 다시 처리)")
+    finally:
+        pipeline.shutdown()
+        print(pipeline.latency_report())
+        metrics.export()
+        print(metrics.summary())
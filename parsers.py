@@ -0,0 +1,120 @@
+# 팀블라인드 목록/본문 HTML 파서 백엔드
+# - bs4: BeautifulSoup(html.parser), 기존 구현
+# - lxml: lxml.html + XPath, 더 빠르지만 일부 페이지에서 bs4와 결과가 다름
+#   (CRLF 줄바꿈, <p> 안의 블록 요소, 본문 안의 <script>/<style>, XML 인코딩 선언 - bench/fixtures 참고)
+import re
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+BACKENDS = ('bs4', 'lxml')
+PARSER_BACKEND = 'bs4'  # 기본 백엔드 (lxml은 bench/bench_parser.py가 모든 fixture에서 일치할 때까지 선택 사항)
+
+BASE_URL = 'https://www.teamblind.com'
+
+def _make_article(topic, title, link, classes, like_text, comment_text):
+    if link and not link.startswith('http'):
+        link = BASE_URL + link
+    return {
+        'topic': topic,
+        'title': title,
+        'link' : link,
+        'content': "",
+        'has_image': 'ico-img' in classes,
+        'has_poll': 'ico-poll' in classes,
+        'like': int(re.search(r'\d+', like_text).group()),
+        'comment': int(re.search(r'\d+', comment_text).group())
+    }
+
+# --- BeautifulSoup 백엔드 ---
+
+def _parse_articles_bs4(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    articles = []
+
+    for item in soup.select('div.topic-list.best div.article'):
+        title_tag = item.select_one('a.tit')
+        articles.append(_make_article(
+            topic=item.select_one('span.topic a').text.strip(),
+            title=title_tag.text.strip(),
+            link=title_tag.get('href'),
+            classes=title_tag['class'] if title_tag.has_attr('class') else [],
+            like_text=item.select_one('span.like').text,
+            comment_text=item.select_one('a.cmt').text
+        ))
+
+    return articles
+
+def _parse_content_bs4(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    tag = soup.select_one('p.contents-txt#contentArea')
+    return tag.text.strip() if tag else None
+
+# --- lxml 백엔드 ---
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+_XPATH_ARTICLES = (
+    f"//div[{_has_class('topic-list')} and {_has_class('best')}]"
+    f"//div[{_has_class('article')}]"
+)
+_XPATH_TOPIC = f".//span[{_has_class('topic')}]//a"
+_XPATH_TITLE = f".//a[{_has_class('tit')}]"
+_XPATH_LIKE = f".//span[{_has_class('like')}]"
+_XPATH_COMMENT = f".//a[{_has_class('cmt')}]"
+_XPATH_CONTENT = f"//p[@id='contentArea' and {_has_class('contents-txt')}]"
+
+def _first(node, xpath):
+    found = node.xpath(xpath)
+    if not found:
+        raise AttributeError(f"요소를 찾을 수 없습니다: {xpath}")
+    return found[0]
+
+def _parse_articles_lxml(html):
+    if not html.strip():
+        return []
+    root = lxml.html.fromstring(html)
+    articles = []
+
+    for item in root.xpath(_XPATH_ARTICLES):
+        title_tag = _first(item, _XPATH_TITLE)
+        articles.append(_make_article(
+            topic=_first(item, _XPATH_TOPIC).text_content().strip(),
+            title=title_tag.text_content().strip(),
+            link=title_tag.get('href'),
+            classes=(title_tag.get('class') or '').split(),
+            like_text=_first(item, _XPATH_LIKE).text_content(),
+            comment_text=_first(item, _XPATH_COMMENT).text_content()
+        ))
+
+    return articles
+
+def _parse_content_lxml(html):
+    if not html.strip():
+        return None
+    found = lxml.html.fromstring(html).xpath(_XPATH_CONTENT)
+    return found[0].text_content().strip() if found else None
+
+# --- 공용 진입점 ---
+
+def _resolve(backend):
+    backend = backend or PARSER_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"알 수 없는 파서 백엔드: {backend}")
+    if backend == 'lxml' and lxml is None:
+        raise ImportError("lxml 백엔드를 쓰려면 lxml을 설치해주세요.")
+    return backend
+
+def parse_articles(html, backend=None):
+    if _resolve(backend) == 'lxml':
+        return _parse_articles_lxml(html)
+    return _parse_articles_bs4(html)
+
+def parse_content(html, backend=None):
+    if _resolve(backend) == 'lxml':
+        return _parse_content_lxml(html)
+    return _parse_content_bs4(html)
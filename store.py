@@ -0,0 +1,243 @@
+# 파이프라인 공용 저장소 (SQLite WAL 모드)
+# 단계별 상태 컬럼으로 대기 중인 글을 인덱스로 조회하고,
+# 각 단계는 엑셀 전체를 다시 쓰는 대신 행 단위로 추가/갱신한다.
+import os
+import sqlite3
+from datetime import datetime
+import pandas as pd
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(script_dir, "blindtube.db")
+EXPORT_EXCEL = False  # True면 크롤링/생성 후 엑셀 보고서도 함께 저장
+
+# 단계 순서 (앞 단계가 done이어야 다음 단계 대기열에 들어감)
+STAGES = ('llm', 'tts', 'video', 'sub', 'upload')
+PREVIOUS_STAGE = {'llm': None, 'tts': 'llm', 'video': 'tts', 'sub': 'video', 'upload': 'sub'}
+
+# 단계 상태값
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+DUPLICATE = 'duplicate'  # 유사 글이 이미 있어 처리하지 않음
+
+# 단계 결과로 갱신 가능한 컬럼
+RESULT_COLUMNS = (
+    'generated_text', 'processing_time',
+    'audio_path', 'video_path', 'output_path', 'video_id',
+)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    link TEXT NOT NULL UNIQUE,
+    topic TEXT,
+    title TEXT,
+    content TEXT,
+    has_image INTEGER,
+    has_poll INTEGER,
+    like_count INTEGER,
+    comment_count INTEGER,
+    crawl_time TEXT,
+    generated_text TEXT,
+    processing_time REAL,
+    audio_path TEXT,
+    video_path TEXT,
+    output_path TEXT,
+    video_id TEXT,
+    {', '.join(f"{stage}_status TEXT NOT NULL DEFAULT '{PENDING}'" for stage in STAGES)},
+    updated_at TEXT
+);
+{''.join(f"CREATE INDEX IF NOT EXISTS idx_articles_{stage}_status ON articles({stage}_status);" for stage in STAGES)}
+"""
+
+# 엑셀과 같은 컬럼 이름으로 조회
+SELECT_COLUMNS = """
+    id, topic, title, link, content, has_image, has_poll,
+    like_count AS "like", comment_count AS "comment", crawl_time,
+    generated_text, processing_time, audio_path, video_path, output_path, video_id,
+    """ + ', '.join(f"{stage}_status" for stage in STAGES)
+
+def now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+def connect(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def _check_stage(stage):
+    if stage not in STAGES:
+        raise ValueError(f"알 수 없는 단계: {stage}")
+
+def add_articles(conn, articles):
+    """새 글 추가 (이미 있는 링크는 무시) - 추가된 글 수 반환"""
+    before = conn.total_changes
+    with conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO articles
+                (link, topic, title, content, has_image, has_poll, like_count, comment_count, crawl_time, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (a['link'], a.get('topic'), a.get('title'), a.get('content'),
+             int(bool(a.get('has_image'))), int(bool(a.get('has_poll'))),
+             a.get('like'), a.get('comment'), a.get('crawl_time'), now())
+            for a in articles
+        ])
+    return conn.total_changes - before
+
+def pending(conn, stage, limit=None):
+    """단계별 처리 대기 글 (앞 단계 완료 + 현재 단계 pending) - id 인덱스 DataFrame"""
+    _check_stage(stage)
+    query = f"SELECT {SELECT_COLUMNS} FROM articles WHERE {stage}_status = ?"
+    params = [PENDING]
+    previous = PREVIOUS_STAGE[stage]
+    if previous:
+        query += f" AND {previous}_status = ?"
+        params.append(DONE)
+    query += " ORDER BY id"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    return pd.read_sql_query(query, conn, params=params, index_col='id')
+
+def claim_next(conn, stage):
+    """대기 중인 글 하나를 running으로 바꾸고 가져옴 (여러 작업자가 같은 글을 잡지 않도록)"""
+    _check_stage(stage)
+    query = f"SELECT id FROM articles WHERE {stage}_status = ?"
+    params = [PENDING]
+    previous = PREVIOUS_STAGE[stage]
+    if previous:
+        query += f" AND {previous}_status = ?"
+        params.append(DONE)
+    query += " ORDER BY id LIMIT 1"
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(query, params).fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        conn.execute(
+            f"UPDATE articles SET {stage}_status = ?, updated_at = ? WHERE id = ?",
+            (RUNNING, now(), row['id'])
+        )
+        job = conn.execute(f"SELECT {SELECT_COLUMNS} FROM articles WHERE id = ?", (row['id'],)).fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return dict(job)
+
+def claim(conn, article_id, stage):
+    """지정한 글이 아직 pending이면 running으로 바꿈 - 이 호출이 가져갔으면 True"""
+    _check_stage(stage)
+    with conn:
+        cursor = conn.execute(
+            f"UPDATE articles SET {stage}_status = ?, updated_at = ? WHERE id = ? AND {stage}_status = ?",
+            (RUNNING, now(), int(article_id), PENDING)
+        )
+    return cursor.rowcount == 1
+
+def update_stage(conn, article_id, stage, status, **fields):
+    """단계 상태와 결과 컬럼을 한 행만 갱신"""
+    _check_stage(stage)
+    unknown = set(fields) - set(RESULT_COLUMNS)
+    if unknown:
+        raise ValueError(f"갱신할 수 없는 컬럼: {', '.join(sorted(unknown))}")
+
+    assignments = [f"{stage}_status = ?", "updated_at = ?"]
+    params = [status, now()]
+    for column, value in fields.items():
+        assignments.append(f"{column} = ?")
+        params.append(value)
+    params.append(int(article_id))
+    with conn:
+        conn.execute(f"UPDATE articles SET {', '.join(assignments)} WHERE id = ?", params)
+
+def get_article(conn, article_id):
+    """글 한 행을 dict로 반환 (없으면 None)"""
+    row = conn.execute(f"SELECT {SELECT_COLUMNS} FROM articles WHERE id = ?", (int(article_id),)).fetchone()
+    return dict(row) if row else None
+
+def stage_state(conn, article_id, stage):
+    """(단계 상태, 마지막 갱신 시각) 반환 - 글이 없으면 (None, None)"""
+    _check_stage(stage)
+    row = conn.execute(
+        f"SELECT {stage}_status, updated_at FROM articles WHERE id = ?", (int(article_id),)
+    ).fetchone()
+    return (row[0], row[1]) if row else (None, None)
+
+def requeue_stale(conn, stage, older_than_seconds):
+    """running 상태로 오래 멈춘 글(작업자 비정상 종료)을 다시 pending으로 - 되돌린 글 수 반환"""
+    _check_stage(stage)
+    cutoff = datetime.fromtimestamp(datetime.now().timestamp() - older_than_seconds).strftime('%Y-%m-%d %H:%M:%S')
+    with conn:
+        cursor = conn.execute(
+            f"UPDATE articles SET {stage}_status = ?, updated_at = ? WHERE {stage}_status = ? AND updated_at < ?",
+            (PENDING, now(), RUNNING, cutoff)
+        )
+    return cursor.rowcount
+
+def requeue_running(conn, stage):
+    """running 상태인 글을 모두 pending으로 (그 단계를 혼자 맡는 프로세스가 시작할 때) - 되돌린 글 수 반환"""
+    _check_stage(stage)
+    with conn:
+        cursor = conn.execute(
+            f"UPDATE articles SET {stage}_status = ?, updated_at = ? WHERE {stage}_status = ?",
+            (PENDING, now(), RUNNING)
+        )
+    return cursor.rowcount
+
+def count_articles(conn):
+    return conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+def load_all(conn):
+    return pd.read_sql_query(
+        f"SELECT {SELECT_COLUMNS} FROM articles ORDER BY crawl_time DESC, id DESC",
+        conn, index_col='id'
+    )
+
+def export_excel(conn, output_path):
+    """보고서용 엑셀 내보내기"""
+    df = load_all(conn)
+    df.to_excel(output_path, index=False, engine='openpyxl')
+    return output_path
+
+def import_excel(conn, excel_path):
+    """기존 엑셀 파일의 글을 저장소로 옮기기 (generated_text가 있으면 LLM 완료 처리)"""
+    df = pd.read_excel(excel_path, engine='openpyxl')
+    df = df.astype(object).where(pd.notnull(df), None)
+    records = df.to_dict('records')
+    added = add_articles(conn, records)
+
+    if 'generated_text' in df.columns:
+        failed_prefixes = ('생성 실패', '처리 오류', '콘텐츠 부족')
+        with conn:
+            conn.executemany(f"""
+                UPDATE articles SET generated_text = ?, llm_status = ?, updated_at = ?
+                WHERE link = ? AND llm_status = '{PENDING}'
+            """, [
+                (r['generated_text'],
+                 FAILED if str(r['generated_text']).startswith(failed_prefixes) else DONE,
+                 now(), r['link'])
+                for r in records if r.get('generated_text')
+            ])
+    return added
+
+def import_legacy(conn):
+    """저장소가 비어 있으면 기존 엑셀 결과물을 한 번 옮겨옴"""
+    if count_articles(conn) > 0:
+        return 0
+    added = 0
+    for filename in ("teamblind_articles.xlsx", "teamblind_articles_processed.xlsx"):
+        excel_path = os.path.join(script_dir, filename)
+        if os.path.exists(excel_path):
+            added += import_excel(conn, excel_path)
+    if added:
+        print(f"기존 엑셀에서 글 {added}개를 저장소로 옮겼습니다.")
+    return added
@@ -1,19 +1,193 @@
-import whisper
-from moviepy.editor import VideoFileClip
 import pysrt
 import os
+import json
+import difflib
+import subprocess
+import numpy as np
 import ffmpeg
 import glob
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import video
+import media
+import metrics
+import timings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def extract_audio(video_path, audio_output="temp_audio.wav"):
-    video = VideoFileClip(video_path)
-    video.audio.write_audiofile(audio_output)
-    return audio_output
+SUBTITLE_STYLE = "FontName=NanumBarunGothic,FontSize=24,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,BackColour=&H80000000,Bold=0,Alignment=10,MarginL=5,MarginR=5,MarginV=25"
 
-def transcribe_audio(audio_path):
-    model = whisper.load_model("medium")  # small, medium, large 가능
-    result = model.transcribe(audio_path, word_timestamps=True)
-    return result
+# 음성 인식 설정
+WHISPER_BACKEND = 'openai'     # 'openai' (openai-whisper) 또는 'faster' (faster-whisper, CPU int8)
+WHISPER_MODEL = 'medium'       # small, medium, large 가능
+WHISPER_COMPUTE_TYPE = 'int8'  # faster 백엔드 양자화 방식 (int8, int8_float32, float32)
+WHISPER_SAMPLE_RATE = 16000    # Whisper 입력 샘플레이트
+
+# 강제 정렬 설정 (TTS 원문을 알고 있으므로 작은 모델의 단어 시간만 빌려 씀)
+ALIGN_SCRIPT = True            # 문장 시간 없이 원문만 있으면 음성 인식 대신 정렬
+ALIGN_MODEL = 'base'           # 정렬용 모델 (CPU에서도 빠른 tiny/base 권장)
+ALIGN_LANGUAGE = 'ko'          # 원문 언어 (언어 감지 생략)
+ALIGN_MIN_MATCH = 0.5          # 원문 글자 중 이 비율 이상 맞아야 정렬 결과 사용 (미만이면 음성 인식)
+
+# 자막 배치 설정
+SUB_WORKERS = None        # 동시 인코딩 수 (None이면 코어 수 / 인코딩 스레드 수, 음성 인식은 항상 한 건씩)
+SUB_ENCODE_THREADS = 4    # 자막 인코딩 1건당 최대 스레드 수
+
+_models = {}  # (백엔드, 모델) -> 로드된 모델, 배치 동안 한 번만 로드
+_models_lock = threading.Lock()  # 여러 작업자 스레드가 같은 모델을 동시에 로드하지 않도록
+
+def load_audio(path, sample_rate=WHISPER_SAMPLE_RATE):
+    """MP3/MP4의 음성을 ffmpeg 파이프로 읽어 16kHz 모노 float32 배열로 반환 (임시 WAV 없음)"""
+    result = subprocess.run(
+        ['ffmpeg', '-nostdin', '-v', 'error', '-i', path,
+         '-f', 's16le', '-ac', '1', '-ar', str(sample_rate), '-'],
+        capture_output=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"음성 읽기 실패: {os.path.basename(path)}: {result.stderr.decode(errors='ignore').strip()}")
+    return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768.0
+
+def get_model(backend=WHISPER_BACKEND, model_name=WHISPER_MODEL):
+    """Whisper 모델을 처음 한 번만 로드하고 재사용"""
+    key = (backend, model_name)
+    with _models_lock:
+        if key not in _models:
+            with metrics.stage('whisper_model_load', backend=backend, model=model_name):
+                _models[key] = _load_model(backend, model_name)
+        return _models[key]
+
+def _load_model(backend, model_name):
+    if backend == 'faster':
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise ImportError("faster 백엔드를 쓰려면 faster-whisper를 설치해주세요.")
+        return WhisperModel(model_name, device='cpu', compute_type=WHISPER_COMPUTE_TYPE)
+    if backend == 'openai':
+        import whisper
+        return whisper.load_model(model_name)
+    raise ValueError(f"알 수 없는 음성 인식 백엔드: {backend}")
+
+def transcribe_audio(audio_path, backend=WHISPER_BACKEND, model_name=WHISPER_MODEL, **options):
+    """음성 인식 결과를 openai-whisper 형식({'segments': [...]})으로 반환 (audio_path 대신 load_audio 결과도 가능)"""
+    model = get_model(backend, model_name)
+    audio = load_audio(audio_path) if isinstance(audio_path, str) else audio_path
+    with metrics.stage('whisper', backend=backend, model=model_name,
+                       audio_seconds=len(audio) / WHISPER_SAMPLE_RATE):
+        if backend == 'openai':
+            return model.transcribe(audio, word_timestamps=True, **options)
+        
+        # faster-whisper는 세그먼트를 순회할 때 디코딩하므로 목록 생성까지 측정
+        segments, _ = model.transcribe(audio, word_timestamps=True, **options)
+        return {'segments': [
+            {
+                'start': segment.start,
+                'end': segment.end,
+                'text': segment.text,
+                'words': [
+                    {'word': w.word, 'start': w.start, 'end': w.end, 'probability': w.probability}
+                    for w in (segment.words or [])
+                ],
+            }
+            for segment in segments
+        ]}
+
+def load_sidecar(video_path, timings_dir):
+    """voice.py가 저장한 TTS 정보 파일 로드 (없으면 None)"""
+    if not timings_dir:
+        return None
+    path = timings.sidecar_path(video_path, timings_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def _alignable(char):
+    # 공백/문장부호는 음성 인식 결과와 달라지기 쉬우므로 글자와 숫자만 비교
+    return char.isalnum()
+
+def align_script(audio_path, script, backend=WHISPER_BACKEND, model_name=ALIGN_MODEL):
+    """원문 문장별 시작/끝 시간을 작은 모델의 단어 시간과 글자 단위로 맞춰 계산 (일치가 너무 적으면 None)"""
+    audio = load_audio(audio_path)
+    duration = len(audio) / WHISPER_SAMPLE_RATE
+    # 언어 고정 + 온도 0: 언어 감지와 온도를 올려 다시 푸는 재시도를 하지 않음
+    transcription = transcribe_audio(audio, backend, model_name, language=ALIGN_LANGUAGE, temperature=0.0)
+    
+    # 인식된 글자마다 시간 (단어 구간을 글자 수로 나눔)
+    heard, heard_times = [], []
+    for segment in transcription['segments']:
+        for word in segment.get('words') or []:
+            chars = [c for c in word['word'].lower() if _alignable(c)]
+            step = (word['end'] - word['start']) / max(len(chars), 1)
+            for i, char in enumerate(chars):
+                heard.append(char)
+                heard_times.append((word['start'] + step * i, word['start'] + step * (i + 1)))
+    
+    # 원문 글자와 문장 번호
+    sentences = timings.split_sentences(script)
+    expected, owners = [], []
+    for index, sentence in enumerate(sentences):
+        for char in sentence.lower():
+            if _alignable(char):
+                expected.append(char)
+                owners.append(index)
+    
+    # 일치하는 글자의 시간을 원문 문장에 모음
+    spans = [None] * len(sentences)
+    matched = 0
+    matcher = difflib.SequenceMatcher(None, expected, heard, autojunk=False)
+    for a, b, size in matcher.get_matching_blocks():
+        matched += size
+        for offset in range(size):
+            index = owners[a + offset]
+            start, end = heard_times[b + offset]
+            if spans[index] is None:
+                spans[index] = [start, end]
+            else:
+                spans[index][1] = max(spans[index][1], end)
+    if not expected or matched / len(expected) < ALIGN_MIN_MATCH:
+        return None
+    
+    segments = [None] * len(sentences)
+    index = 0
+    while index < len(sentences):
+        previous_end = segments[index - 1]['end'] if index else 0.0
+        if spans[index] is not None:
+            start = max(spans[index][0], previous_end)
+            segments[index] = {'start': round(start, 3), 'end': round(max(spans[index][1], start), 3), 'text': sentences[index]}
+            index += 1
+            continue
+        
+        # 일치하는 글자가 없는 문장이 이어지면 앞 문장 끝 ~ 다음 일치 문장 시작(없으면 음성 끝)을 글자 수 비율로 나눔
+        run_end = index
+        while run_end < len(sentences) and spans[run_end] is None:
+            run_end += 1
+        gap_end = max(spans[run_end][0] if run_end < len(sentences) else duration, previous_end)
+        weights = [max(1, sum(1 for c in sentences[k] if _alignable(c))) for k in range(index, run_end)]
+        position = previous_end
+        for k, weight in zip(range(index, run_end), weights):
+            length = (gap_end - previous_end) * weight / sum(weights)
+            segments[k] = {'start': round(position, 3), 'end': round(position + length, 3), 'text': sentences[k]}
+            position += length
+        index = run_end
+    return {'text': script, 'segments': segments}
+
+def build_transcription(video_path, timings_dir, audio_source):
+    """자막 시간 결정: TTS 문장 시간 > 원문 강제 정렬 > 음성 인식"""
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    sidecar = load_sidecar(video_path, timings_dir)
+    if sidecar and sidecar.get('segments'):
+        print(f"TTS 시간 정보로 자막 생성: {base_name}")
+        return sidecar
+    if ALIGN_SCRIPT and sidecar and sidecar.get('text', '').strip():
+        aligned = align_script(audio_source, sidecar['text'])
+        if aligned is not None:
+            print(f"원문 정렬로 자막 생성: {base_name}")
+            return aligned
+        print(f"원문 정렬 실패, 음성 인식으로 자막 생성: {base_name}")
+    return transcribe_audio(audio_source)
 
 def create_subtitles(transcription, output_srt="subtitles.srt"):
     subs = pysrt.SubRipFile()
@@ -31,57 +205,212 @@ def create_subtitles(transcription, output_srt="subtitles.srt"):
     subs.save(output_srt)
     return output_srt
 
-def burn_subtitles(video_input, srt_path, output_video="output.mp4"):
-    (
-        ffmpeg
-        .input(video_input)
-        .filter("subtitles", srt_path, 
-                force_style="FontName=NanumBarunGothic,FontSize=24,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,BackColour=&H80000000,Bold=0,Alignment=10,MarginL=5,MarginR=5,MarginV=25")
-        .output(
-            ffmpeg.input(video_input).audio,  # 오디오 스트림 추가
-            output_video,
-            vcodec="libx264",
-            acodec="aac",  # 오디오 코덱 명시적 지정
-            **{'preset': 'fast'}
+def burn_subtitles(video_input, srt_path, output_video="output.mp4", threads=SUB_ENCODE_THREADS):
+    info = media.probe(video_input)
+    with metrics.stage('sub_encode', threads=threads, frames=int(info['duration'] * info['fps'])):
+        (
+            ffmpeg
+            .input(video_input)
+            .filter("subtitles", srt_path, force_style=SUBTITLE_STYLE)
+            .output(
+                ffmpeg.input(video_input).audio,  # 오디오 스트림 추가
+                output_video,
+                vcodec="libx264",
+                acodec="aac",  # 오디오 코덱 명시적 지정
+                threads=threads,
+                **{'preset': 'fast'}
+            )
+            .run(overwrite_output=True)
         )
-        .run(overwrite_output=True)
-    )
     return output_video
 
-def process_video(video_path, output_dir):
+def prepare_subtitles(video_path, srt_path, timings_dir=None):
+    """자막 시간을 정해 SRT로 저장 (Whisper 모델을 쓰는 부분)"""
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    
+    # 같은 이름의 TTS MP3가 있으면 영상 대신 MP3를 바로 읽음
+    audio_source = video_path
+    if timings_dir and os.path.exists(os.path.join(timings_dir, base_name + ".mp3")):
+        audio_source = os.path.join(timings_dir, base_name + ".mp3")
+    transcription = build_transcription(video_path, timings_dir, audio_source)
+    return create_subtitles(transcription, srt_path)
+
+def _encode_job(video_path, srt_path, work_dir, output_video, threads):
+    # 작업 프로세스에서는 인코딩만 (모델을 로드하지 않음)
+    temp_video = os.path.join(work_dir, "output.mp4")
+    burn_subtitles(video_path, srt_path, temp_video, threads)
+    
+    # 완성된 파일만 출력 폴더로 옮김 (중단돼도 반쯤 쓴 결과가 남지 않음)
+    os.replace(temp_video, output_video)
+    return output_video
+
+def process_video(video_path, output_dir, timings_dir=None, threads=SUB_ENCODE_THREADS):
     base_name = os.path.splitext(os.path.basename(video_path))[0]
+    output_video = os.path.join(output_dir, f"{base_name}.mp4")
     
-    # 임시 파일 경로 설정
-    audio_path = os.path.join(output_dir, f"temp_{base_name}.wav")
-    srt_path = os.path.join(output_dir, f"temp_{base_name}.srt")
+    # 작업마다 별도 임시 폴더를 써서 여러 영상을 동시에 처리해도 파일이 섞이지 않음
+    with metrics.stage('sub'), tempfile.TemporaryDirectory(prefix="sub_", dir=output_dir) as work_dir:
+        srt_path = prepare_subtitles(video_path, os.path.join(work_dir, "subtitles.srt"), timings_dir)
+        _encode_job(video_path, srt_path, work_dir, output_video, threads)
+    
+    return output_video
+
+def is_up_to_date(video_path, output_dir, timings_dir=None):
+    """출력 영상이 입력 영상과 TTS 시간 정보보다 나중에 만들어졌으면 True"""
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
     output_video = os.path.join(output_dir, f"{base_name}.mp4")
+    if not os.path.exists(output_video):
+        return False
+    inputs = [video_path]
+    if timings_dir:
+        inputs.append(timings.sidecar_path(video_path, timings_dir))
+    output_mtime = os.path.getmtime(output_video)
+    return all(output_mtime >= os.path.getmtime(path) for path in inputs if os.path.exists(path))
+
+def process_all(input_dir, output_dir, timings_dir=None, workers=SUB_WORKERS, threads=SUB_ENCODE_THREADS, force=False):
+    """merged_videos의 영상에 자막을 입혀 output_videos에 저장 (변경 없는 영상은 건너뜀)"""
+    os.makedirs(output_dir, exist_ok=True)
+    video_files = sorted(glob.glob(os.path.join(input_dir, "*.mp4")))
+    jobs = [path for path in video_files if force or not is_up_to_date(path, output_dir, timings_dir)]
+    if len(jobs) < len(video_files):
+        print(f"변경 없는 영상 {len(video_files) - len(jobs)}개 건너뜀")
+    
+    workers, threads = video.plan_workers(workers, threads)
+    success = 0
+    fail = 0
+    
+    if workers > 1 and len(jobs) > 1:
+        # 음성 인식은 이 프로세스에서 한 건씩 (Whisper 모델 1개), 인코딩만 작업 프로세스에 나눔
+        print(f"동시 인코딩 {workers}개, 인코딩당 스레드 {threads}개")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for video_path in jobs:
+                base_name = os.path.splitext(os.path.basename(video_path))[0]
+                work_dir = tempfile.mkdtemp(prefix="sub_", dir=output_dir)
+                try:
+                    srt_path = prepare_subtitles(video_path, os.path.join(work_dir, "subtitles.srt"), timings_dir)
+                except Exception as e:
+                    print(f"Error Details: {video_path}: {str(e)}")
+                    shutil.rmtree(work_dir, ignore_errors=True)
+                    fail += 1
+                    continue
+                output_video = os.path.join(output_dir, f"{base_name}.mp4")
+                future = executor.submit(_encode_job, video_path, srt_path, work_dir, output_video, threads)
+                futures[future] = (video_path, work_dir)
+            
+            for future in as_completed(futures):
+                video_path, work_dir = futures[future]
+                try:
+                    print(f"Completed: {future.result()}")
+                    success += 1
+                except Exception as e:
+                    print(f"Error Details: {video_path}: {str(e)}")
+                    fail += 1
+                finally:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+    else:
+        for video_path in jobs:
+            print(f"Processing: {video_path}")
+            try:
+                print(f"Completed: {process_video(video_path, output_dir, timings_dir, threads)}")
+                success += 1
+            except Exception as e:
+                print(f"Error Details: {str(e)}")
+                fail += 1
     
-    # 처리 파이프라인
-    extract_audio(video_path)
-    transcription = transcribe_audio("temp_audio.wav")
-    create_subtitles(transcription)
-    burn_subtitles(video_path, "subtitles.srt", output_video)
+    metrics.export()
+    print(f"\n처리 완료: {success}개 성공, {fail}개 실패")
+    return success, fail
+
+def render_short(background_path, audio_path, srt_path, output_video, threads=video.ENCODE_THREADS):
+    """배경 + TTS 음성 + 자막을 한 번의 인코딩으로 최종 영상까지 생성 (merged_videos 생략)"""
+    duration = media.probe(audio_path)['duration']
+    video.check_duration(duration, audio_path)
     
-    # 임시 파일 삭제
-    os.remove("temp_audio.wav")
-    os.remove("subtitles.srt")
+    list_path = None
+    if os.path.isdir(background_path):
+        # 사전 변환된 배경 조각을 음성 길이만큼 이어 붙임
+        list_path = video.write_concat_list(background_path, duration)
+        background = ffmpeg.input(list_path, f='concat', safe=0)
+    else:
+        background = ffmpeg.input(background_path, stream_loop=-1)
     
+    try:
+        with metrics.stage('render', threads=threads, frames=int(duration * video.OUTPUT_FPS)):
+            (
+                background.video
+                .filter("subtitles", srt_path, force_style=SUBTITLE_STYLE)
+                .output(
+                    ffmpeg.input(audio_path).audio,
+                    output_video,
+                    t=f"{duration:.3f}",
+                    vcodec="libx264",
+                    acodec="aac",
+                    pix_fmt="yuv420p",
+                    r=video.OUTPUT_FPS,
+                    ar=video.AUDIO_SAMPLE_RATE,
+                    threads=threads,
+                    **{'preset': 'fast'}
+                )
+                .run(overwrite_output=True, quiet=True)
+            )
+    except ffmpeg.Error as e:
+        # quiet=True로 숨긴 ffmpeg 출력을 오류 메시지에 포함
+        stderr = (e.stderr or b'').decode(errors='ignore').strip()
+        raise RuntimeError(f"ffmpeg 실패: {os.path.basename(output_video)}: {stderr[-500:]}") from e
+    finally:
+        if list_path:
+            os.remove(list_path)
     return output_video
 
+def render_audio(audio_path, background_path, output_dir, timings_dir=None, threads=video.ENCODE_THREADS):
+    """MP3 한 개를 자막이 들어간 최종 영상으로 렌더링"""
+    base_name = os.path.splitext(os.path.basename(audio_path))[0]
+    output_video = os.path.join(output_dir, f"{base_name}.mp4")
+    
+    transcription = build_transcription(audio_path, timings_dir or os.path.dirname(audio_path), audio_path)
+    
+    # process_video와 같이 임시 폴더에서 렌더링한 뒤 완성된 파일만 옮김 (업로드가 쓰는 중인 파일을 집지 않도록)
+    with tempfile.TemporaryDirectory(prefix="render_", dir=output_dir) as work_dir:
+        srt_path = os.path.join(work_dir, "subtitles.srt")
+        temp_video = os.path.join(work_dir, "output.mp4")
+        create_subtitles(transcription, srt_path)
+        render_short(background_path, audio_path, srt_path, temp_video, threads)
+        os.replace(temp_video, output_video)
+    return output_video
+
+def render_all(tts_dir, output_dir, background_dir, timings_dir=None):
+    """blind_tts의 MP3를 배경 합성과 자막 입히기까지 한 번에 처리"""
+    os.makedirs(output_dir, exist_ok=True)
+    background_videos = video.load_backgrounds(background_dir)
+    
+    for audio_path in sorted(glob.glob(os.path.join(tts_dir, "*.mp3"))):
+        print(f"Processing: {audio_path}")
+        try:
+            result_path = render_audio(audio_path, random.choice(background_videos), output_dir, timings_dir)
+        except Exception as e:
+            print(f"Error Details: {str(e)}")
+            continue
+        print(f"Completed: {result_path}")
+    metrics.export()
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="자막 입히기")
+    parser.add_argument('--single-pass', action='store_true',
+                        help="merged_videos 없이 blind_tts + background에서 바로 최종 영상 생성 (인코딩 1회)")
+    parser.add_argument('--workers', type=int, default=SUB_WORKERS, help="동시 인코딩 수 (기본: 코어 수에 맞춤)")
+    parser.add_argument('--force', action='store_true', help="이미 만든 영상도 다시 처리")
+    args = parser.parse_args()
+    
     script_dir = os.path.dirname(os.path.abspath(__file__))
     input_dir = os.path.join(script_dir, "merged_videos")
     output_dir = os.path.join(script_dir, "output_videos")
+    timings_dir = os.path.join(script_dir, "blind_tts")  # voice.py 출력 폴더
+    background_dir = os.path.join(script_dir, "background")
     
-    # 출력 폴더 생성
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # MP4 파일 목록 가져오기
-    video_files = glob.glob(os.path.join(input_dir, "*.mp4"))
-    
-    for video_path in video_files:
-        print(f"Processing: {video_path}")
-        result_path = process_video(video_path, output_dir)
-        print(f"Completed: {result_path}")
+    if args.single_pass:
+        render_all(timings_dir, output_dir, background_dir)
+    else:
+        process_all(input_dir, output_dir, timings_dir, workers=args.workers, force=args.force)
     
     print("All videos processed successfully.")
\ No newline at end of file
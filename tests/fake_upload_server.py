@@ -0,0 +1,159 @@
+# 유튜브 재개 가능 업로드(resumable upload)를 흉내 내는 로컬 서버 (테스트용)
+# - POST /upload/youtube/v3/videos?uploadType=resumable → 세션 주소(Location) 발급
+# - PUT 세션 주소 → 조각을 이어 붙이고 308(Range) 또는 200(동영상 정보)으로 응답
+# - PUT "Content-Range: bytes */전체크기" → 지금까지 받은 위치만 알려줌 (클라이언트가 오류 후 재개할 때)
+# - 할당량 초과(403 quotaExceeded), 조각 응답 유실(503), 서버 장애(항상 503)를 설정으로 재현
+#
+#   python tests/fake_upload_server.py --port 8080
+#   python youtube.py --api-endpoint http://localhost:8080/
+import re
+import json
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+UPLOAD_PATH = "/upload/youtube/v3/videos"
+SESSION_PATH = "/upload/session/"
+
+class FakeUploadServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.lock = threading.Lock()
+        self.sessions = {}        # 세션 id -> {'metadata', 'size', 'data'}
+        self.uploads = {}         # 완료된 동영상 id -> 받은 바이트
+        self.puts = []            # 데이터 조각 PUT마다 (시작 위치, 응답 코드)
+        self.quota_errors = 0     # 이 횟수만큼 업로드 시작을 quotaExceeded로 거절
+        self.quota_rejections = 0
+        self.lose_responses = set()  # 이 순번(1부터)의 조각은 받아 둔 뒤 503 응답 (응답 유실)
+        self.unavailable = False     # True면 모든 조각에 503 응답 (받지 않음)
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # 테스트 출력에 접속 기록을 남기지 않음
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _reply(self, status, body=None, headers=None):
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if payload:
+            self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _reply_progress(self, received):
+        # 308 Resume Incomplete - 받은 바이트가 있으면 마지막 위치를 Range로 알림
+        headers = {'Range': f"bytes=0-{received - 1}"} if received else {}
+        self._reply(308, headers=headers)
+
+    def do_POST(self):
+        server = self.server
+        url = urlparse(self.path)
+        body = self._read_body()
+        if url.path != UPLOAD_PATH or parse_qs(url.query).get('uploadType') != ['resumable']:
+            self._reply(404, {'error': {'code': 404, 'message': 'not found'}})
+            return
+
+        with server.lock:
+            if server.quota_errors > 0:
+                server.quota_errors -= 1
+                server.quota_rejections += 1
+                self._reply(403, {'error': {
+                    'code': 403,
+                    'message': 'The request cannot be completed because you have exceeded your quota.',
+                    'errors': [{'reason': 'quotaExceeded', 'domain': 'youtube.quota'}],
+                }})
+                return
+            session_id = uuid.uuid4().hex
+            server.sessions[session_id] = {
+                'metadata': json.loads(body or b'{}'),
+                'size': int(self.headers.get('X-Upload-Content-Length') or 0),
+                'data': bytearray(),
+            }
+        self._reply(200, headers={'Location': f"{server.url.rstrip('/')}{SESSION_PATH}{session_id}"})
+
+    def do_PUT(self):
+        server = self.server
+        body = self._read_body()
+        session_id = self.path[len(SESSION_PATH):] if self.path.startswith(SESSION_PATH) else None
+        session = server.sessions.get(session_id)
+        if session is None:
+            self._reply(404, {'error': {'code': 404, 'message': 'unknown upload session'}})
+            return
+
+        content_range = self.headers.get('Content-Range', '')
+        if content_range.startswith('bytes */'):
+            self._reply_progress(len(session['data']))
+            return
+        match = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', content_range)
+        if not match:
+            self._reply(400, {'error': {'code': 400, 'message': 'bad Content-Range'}})
+            return
+
+        start = int(match.group(1))
+        with server.lock:
+            number = len(server.puts) + 1
+            if server.unavailable:
+                server.puts.append((start, 503))
+                self._reply(503, {'error': {'code': 503, 'message': 'backend unavailable'}})
+                return
+            if start != len(session['data']):
+                # 받은 위치와 다른 곳부터 보내면 현재 위치만 알려줌
+                server.puts.append((start, 308))
+                self._reply_progress(len(session['data']))
+                return
+            session['data'] += body
+            done = len(session['data']) >= session['size']
+            status = 503 if number in server.lose_responses else (200 if done else 308)
+            server.puts.append((start, status))
+            if done and status == 200:
+                video_id = f"fake_{session_id[:11]}"
+                server.uploads[video_id] = bytes(session['data'])
+
+        if status == 503:
+            self._reply(503, {'error': {'code': 503, 'message': 'backend error'}})
+        elif status == 200:
+            self._reply(200, {'kind': 'youtube#video', 'id': video_id, **session['metadata']})
+        else:
+            self._reply_progress(len(session['data']))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="가짜 유튜브 업로드 서버 (테스트용)")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--quota-errors', type=int, default=0, help="업로드 시작을 할당량 초과로 거절할 횟수")
+    parser.add_argument('--lose', type=int, nargs='*', default=[], help="받은 뒤 503으로 응답할 조각 순번")
+    args = parser.parse_args()
+
+    server = FakeUploadServer(args.port)
+    server.quota_errors = args.quota_errors
+    server.lose_responses = set(args.lose)
+    print(f"가짜 업로드 서버: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
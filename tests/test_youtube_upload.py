@@ -0,0 +1,115 @@
+# youtube.py 업로드 재시도/할당량 처리를 가짜 업로드 서버로 확인
+#
+#   python -m unittest discover tests
+#   python -m pytest tests
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(script_dir))
+sys.path.insert(0, script_dir)
+
+try:
+    from googleapiclient.errors import HttpError
+    import youtube
+except ImportError as e:
+    raise unittest.SkipTest(f"google-api-python-client 미설치: {e}")
+
+import metrics
+from fake_upload_server import FakeUploadServer
+
+CHUNK = 256 * 1024  # 재개 가능 업로드 최소 조각 크기
+
+class UploadTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeUploadServer().start()
+        self.addCleanup(self.server.stop)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.output_dir = os.path.join(self.tmp, "output_videos")
+        os.makedirs(self.output_dir)
+        self.filename = "001_테스트_영상.mp4"
+        self.video_path = os.path.join(self.output_dir, self.filename)
+        self.data = os.urandom(CHUNK * 2 + 1000)  # 조각 3개
+        with open(self.video_path, 'wb') as f:
+            f.write(self.data)
+
+        # 재시도/할당량 대기는 실제로 기다리지 않고 기록만
+        self.sleeps = []
+        self.on_sleep = None
+        def sleep(seconds):
+            self.sleeps.append(seconds)
+            if self.on_sleep:
+                self.on_sleep()
+        for patch in (
+            mock.patch.object(youtube.time, 'sleep', sleep),
+            mock.patch.object(metrics, 'ENABLED', False),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def service(self):
+        service = youtube.build_service(api_endpoint=self.server.url)
+        self.addCleanup(service.close)
+        return service
+
+    def test_resumes_from_server_offset_after_5xx(self):
+        # 두 번째 조각은 서버가 받았지만 응답이 503 → 서버가 알려준 위치(세 번째 조각)부터 이어서 전송
+        self.server.lose_responses = {2}
+        video_id = youtube.upload_short(self.service(), self.video_path, "제목", "설명", chunksize=CHUNK)
+
+        self.assertEqual(self.server.uploads[video_id], self.data)
+        self.assertEqual(self.server.puts, [(0, 308), (CHUNK, 503), (CHUNK * 2, 200)])
+        self.assertEqual(len(self.sleeps), 1)
+
+    def test_quota_exceeded_exhausts_and_waits_for_reset(self):
+        self.server.quota_errors = 1
+        quota = youtube.QuotaTracker(os.path.join(self.tmp, "quota.json"))
+        # 대기가 끝나면 태평양 시간 자정이 지난 것처럼 사용량 기록을 지움
+        self.on_sleep = lambda: os.remove(quota.path)
+
+        with mock.patch.object(youtube, 'UPLOAD_FOLDER', self.output_dir), \
+             mock.patch.object(youtube, 'UPLOADED_FOLDER', os.path.join(self.tmp, "trash")), \
+             mock.patch.object(youtube, 'validate_shorts', lambda path: None):
+            results = youtube.upload_all([self.filename], self.service, quota, workers=1, chunksize=CHUNK)
+
+        video_id = results[self.filename]
+        self.assertEqual(self.server.quota_rejections, 1)
+        self.assertEqual(self.server.uploads[video_id], self.data)
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertGreaterEqual(self.sleeps[0], 60)  # 초기화 시각 + 60초
+        self.assertEqual(quota.remaining(), youtube.DAILY_QUOTA - youtube.UPLOAD_COST)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, "trash", self.filename)))
+
+    def test_quota_exceeded_without_wait_gives_up(self):
+        self.server.quota_errors = 1
+        quota = youtube.QuotaTracker(os.path.join(self.tmp, "quota.json"))
+
+        with mock.patch.object(youtube, 'UPLOAD_FOLDER', self.output_dir), \
+             mock.patch.object(youtube, 'validate_shorts', lambda path: None):
+            results = youtube.upload_all([self.filename], self.service, quota, workers=1,
+                                         chunksize=CHUNK, wait_for_quota=False)
+
+        self.assertIsNone(results[self.filename])
+        self.assertEqual(quota.remaining(), 0)
+        self.assertEqual(self.sleeps, [])
+        self.assertTrue(os.path.exists(self.video_path))
+
+    def test_gives_up_after_max_retries(self):
+        self.server.unavailable = True
+        with self.assertRaises(HttpError) as ctx:
+            youtube.upload_short(self.service(), self.video_path, "제목", "설명", chunksize=CHUNK, max_retries=2)
+
+        self.assertEqual(ctx.exception.resp.status, 503)
+        self.assertEqual(self.server.puts, [(0, 503)] * 3)  # 첫 시도 + 재시도 2회
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertLess(self.sleeps[0], self.sleeps[1])  # 지수 백오프
+        self.assertEqual(self.server.uploads, {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+# TTS 문장 분할 규칙과 문장별 시간 정보 파일 위치
+# voice.py(합성)와 sub.py(자막)가 같은 규칙을 쓰도록 무거운 의존성 없이 분리
+import os
+import re
+
+TIMINGS_SUFFIX = ".timings.json"  # MP3와 함께 저장하는 문장별 시작/끝 시간
+
+def split_sentences(text, min_chars=10):
+    """문장 부호 기준으로 나누고, 너무 짧은 조각은 다음 문장과 합침"""
+    sentences = []
+    for part in re.split(r'(?<=[.!?…~])\s+', text):
+        part = part.strip()
+        if not part:
+            continue
+        if sentences and len(sentences[-1]) < min_chars:
+            sentences[-1] += ' ' + part
+        else:
+            sentences.append(part)
+    return sentences
+
+def timings_path(audio_path):
+    return os.path.splitext(audio_path)[0] + TIMINGS_SUFFIX
+
+def sidecar_path(media_path, timings_dir):
+    """다른 폴더의 영상과 같은 이름의 시간 정보 파일 경로"""
+    base_name = os.path.splitext(os.path.basename(media_path))[0]
+    return os.path.join(timings_dir, base_name + TIMINGS_SUFFIX)
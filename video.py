@@ -1,51 +1,275 @@
 import os
+import sys
+import json
+import time
 import random
+import shutil
+import hashlib
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from moviepy.editor import VideoFileClip, AudioFileClip
+import media
+import metrics
+
+# 합성 설정
+MERGE_BACKEND = 'auto'  # 'ffmpeg', 'moviepy', 'auto' (ffmpeg/ffprobe가 있으면 ffmpeg)
+OUTPUT_FPS = 24
+ENCODE_THREADS = 6         # 인코딩 1건당 최대 스레드 수
+MERGE_WORKERS = None       # 동시 합성 수 (None이면 코어 수 / 인코딩 스레드 수)
+MERGE_TASKS_PER_CHILD = 20 # 워커 프로세스를 이만큼 처리한 뒤 새로 띄워 메모리/파일 핸들 누적 방지
+AUDIO_SAMPLE_RATE = 44100  # MoviePy 기본 출력과 동일
+MIN_DURATION = 10
+MAX_DURATION = 180
+
+# 배경 영상 사전 변환 캐시 (9:16 H.264, 고정 fps/GOP, 키프레임 단위 조각)
+USE_BACKGROUND_CACHE = True
+BACKGROUND_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "background_cache")
+CANONICAL_WIDTH = 1080
+CANONICAL_HEIGHT = 1920
+SEGMENT_SECONDS = 2  # GOP 길이와 같게 맞춰 조각마다 키프레임으로 시작
+MANIFEST_NAME = "manifest.json"
+
+def ffmpeg_available():
+    return shutil.which('ffmpeg') is not None and shutil.which('ffprobe') is not None
+
+def run_ffmpeg(args):
+    result = subprocess.run(['ffmpeg', '-y', '-v', 'error'] + args, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg 실패: {result.stderr.strip()[-500:]}")
+
+def check_duration(duration, audio_path):
+    # 길이 검사 (10초 이상, 180초 이하)
+    if duration < MIN_DURATION:
+        raise ValueError(f"{os.path.basename(audio_path)}: {MIN_DURATION}초 미만")
+    if duration > MAX_DURATION:
+        raise ValueError(f"{os.path.basename(audio_path)}: {MAX_DURATION}초 초과")
+
+def _merge_ffmpeg(background_path, audio_path, output_path, duration, threads=ENCODE_THREADS):
+    background = media.probe(background_path)
+    
+    # 배경 반복(-stream_loop)과 음성 길이 자르기를 ffmpeg 안에서 처리
+    args = [
+        '-stream_loop', '-1', '-i', background_path,
+        '-i', audio_path,
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-t', f"{duration:.3f}",
+    ]
+    
+    # 배경이 이미 출력 형식(H.264, yuv420p, 24fps)이면 재인코딩 없이 복사
+    if (background['video_codec'] == 'h264' and background['pix_fmt'] == 'yuv420p'
+            and abs(background['fps'] - OUTPUT_FPS) < 0.01):
+        args += ['-c:v', 'copy']
+    else:
+        args += [
+            '-c:v', 'libx264', '-preset', 'medium', '-pix_fmt', 'yuv420p',
+            '-r', str(OUTPUT_FPS), '-threads', str(threads),
+        ]
+    
+    args += ['-c:a', 'aac', '-ar', str(AUDIO_SAMPLE_RATE), output_path]
+    run_ffmpeg(args)
+
+def _merge_moviepy(background_path, audio_path, output_path, threads=ENCODE_THREADS):
+    # 영상과 음성 로드
+    video = VideoFileClip(background_path, audio=False)
+    audio = AudioFileClip(audio_path)
 
-def merge_audio_video(background_path, audio_path, output_path):
     try:
-        # 영상과 음성 로드
-        video = VideoFileClip(background_path, audio=False)
-        audio = AudioFileClip(audio_path)
-
-        # 길이 검사 (10초 이상)
-        if audio.duration < 10:
-            audio.close()
-            video.close()
-            raise ValueError(f"{os.path.basename(audio_path)}: 10초 미만")
-
-        # 길이 검사 (180초 이하)
-        if audio.duration > 180:
-            audio.close()
-            video.close()
-            raise ValueError(f"{os.path.basename(audio_path)}: 180초 초과")
+        check_duration(audio.duration, audio_path)
 
         # 동영상 길이를 음성에 맞춤
-        video = video.loop(duration=audio.duration)
+        looped = video.loop(duration=audio.duration)
         
         # 음성 추가
-        final_clip = video.set_audio(audio)
+        final_clip = looped.set_audio(audio)
         
         # 출력 설정
         final_clip.write_videofile(
             output_path,
             codec='libx264',
             audio_codec='aac',
-            fps=24,
-            threads=6,
+            fps=OUTPUT_FPS,
+            threads=threads,
             verbose=False
         )
+    finally:
+        audio.close()
+        video.close()
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def _normalize_background(source_path, target_dir):
+    """배경 영상을 표준 형식으로 변환해 키프레임 단위 조각으로 저장"""
+    with metrics.stage('background_normalize') as m:
+        m['frames'] = _segment_background(source_path, target_dir)
+
+def _segment_background(source_path, target_dir):
+    # 변환한 프레임 수 반환
+    work_dir = tempfile.mkdtemp(prefix=".tmp_", dir=os.path.dirname(target_dir))
+    try:
+        gop = OUTPUT_FPS * SEGMENT_SECONDS
+        run_ffmpeg([
+            '-i', source_path, '-an',
+            '-vf', (f"scale={CANONICAL_WIDTH}:{CANONICAL_HEIGHT}:force_original_aspect_ratio=increase,"
+                    f"crop={CANONICAL_WIDTH}:{CANONICAL_HEIGHT},setsar=1,fps={OUTPUT_FPS}"),
+            '-c:v', 'libx264', '-preset', 'medium', '-pix_fmt', 'yuv420p',
+            '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0',
+            '-force_key_frames', f"expr:gte(t,n_forced*{SEGMENT_SECONDS})",
+            '-f', 'segment', '-segment_time', str(SEGMENT_SECONDS),
+            '-segment_format', 'mp4', '-reset_timestamps', '1',
+            os.path.join(work_dir, 'seg_%04d.mp4')
+        ])
+        
+        segments = []
+        for name in sorted(os.listdir(work_dir)):
+            duration = media.probe(os.path.join(work_dir, name), cache_db=None)['duration']
+            if duration > 0:
+                segments.append({'file': name, 'duration': duration})
+        if not segments:
+            raise RuntimeError(f"변환 결과가 없습니다: {os.path.basename(source_path)}")
+        
+        _save_json(os.path.join(work_dir, MANIFEST_NAME), {
+            'source': os.path.basename(source_path),
+            'segments': segments,
+            'duration': sum(seg['duration'] for seg in segments)
+        })
+        shutil.rmtree(target_dir, ignore_errors=True)  # 이전에 중단된 변환 결과
+        os.replace(work_dir, target_dir)
+        return int(sum(seg['duration'] for seg in segments) * OUTPUT_FPS)
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+def prepare_backgrounds(background_videos, cache_dir=BACKGROUND_CACHE_DIR):
+    """배경 영상을 한 번만 표준 형식으로 변환 (원본 mtime/크기가 같으면 해시도 다시 계산하지 않음)"""
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, "index.json")
+    index = _load_json(index_path, {})
+    prepared = []
+    
+    for source_path in background_videos:
+        stat = os.stat(source_path)
+        entry = index.get(source_path)
+        if not entry or entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+            entry = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': file_sha256(source_path)}
+            index[source_path] = entry
+        
+        target_dir = os.path.join(cache_dir, entry['sha256'][:16])
+        if not os.path.exists(os.path.join(target_dir, MANIFEST_NAME)):
+            print(f"배경 변환 중: {os.path.basename(source_path)}")
+            try:
+                _normalize_background(source_path, target_dir)
+            except Exception as e:
+                print(f"배경 변환 실패 (원본 사용): {str(e)}")
+                prepared.append(source_path)
+                continue
+        prepared.append(target_dir)
+    
+    _save_json(index_path, index)
+    return prepared
+
+def background_name(background_path):
+    if os.path.isdir(background_path):
+        return _load_json(os.path.join(background_path, MANIFEST_NAME), {}).get('source', background_path)
+    return os.path.basename(background_path)
+
+def write_concat_list(background_dir, duration):
+    """음성 길이만큼 조각을 이어 붙일 concat 목록 파일 경로 (사용 후 삭제 필요)"""
+    manifest = _load_json(os.path.join(background_dir, MANIFEST_NAME), None)
+    segments = manifest['segments']
+    
+    # 임의의 조각에서 시작해 음성 길이만큼 반복
+    lines = []
+    total = 0.0
+    position = random.randrange(len(segments))
+    while total < duration:
+        segment = segments[position % len(segments)]
+        segment_path = os.path.join(background_dir, segment['file']).replace("'", "'\\''")
+        lines.append(f"file '{segment_path}'")
+        total += segment['duration']
+        position += 1
+    
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+        return f.name
+
+def _merge_segments(background_dir, audio_path, output_path, duration):
+    """사전 변환된 조각을 이어 붙이고(스트림 복사) 음성만 인코딩"""
+    list_path = write_concat_list(background_dir, duration)
+    try:
+        run_ffmpeg([
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-i', audio_path,
+            '-map', '0:v:0', '-map', '1:a:0',
+            '-t', f"{duration:.3f}",
+            '-c:v', 'copy',
+            '-c:a', 'aac', '-ar', str(AUDIO_SAMPLE_RATE),
+            output_path
+        ])
+    finally:
+        os.remove(list_path)
+
+def merge_audio_video(background_path, audio_path, output_path, backend=MERGE_BACKEND, threads=ENCODE_THREADS):
+    try:
+        if backend == 'auto':
+            backend = 'ffmpeg' if ffmpeg_available() else 'moviepy'
+        
+        with metrics.stage('video', backend=backend, threads=threads,
+                           segments=os.path.isdir(background_path)) as m:
+            # 클립을 열기 전에 음성 길이부터 확인 (ffprobe 결과는 캐시됨)
+            if ffmpeg_available():
+                duration = media.probe(audio_path)['duration']
+                check_duration(duration, audio_path)
+                m['frames'] = int(duration * OUTPUT_FPS)
+            
+            if backend == 'ffmpeg':
+                if os.path.isdir(background_path):
+                    _merge_segments(background_path, audio_path, output_path, duration)
+                else:
+                    _merge_ffmpeg(background_path, audio_path, output_path, duration, threads)
+            else:
+                _merge_moviepy(background_path, audio_path, output_path, threads)
         return True
         
     except Exception as e:
         print(f"Error Details: {str(e)}")
         return False
 
-def batch_merge(tts_folder, output_folder, background_folder):
-    """폴더 내 모든 MP3 파일 처리"""
-    os.makedirs(output_folder, exist_ok=True)
-    
-    # 배경 동영상 목록 불러오기
+def plan_workers(workers=MERGE_WORKERS, threads=ENCODE_THREADS):
+    """(동시 합성 수, 인코딩 1건당 스레드 수) - 코어 수를 넘지 않도록 배분"""
+    cores = os.cpu_count() or 1
+    threads = max(1, min(threads, cores))
+    if workers is None:
+        workers = max(1, cores // threads)
+    else:
+        threads = max(1, min(threads, cores // workers))
+    return workers, threads
+
+def _merge_job(job):
+    background_path, audio_path, output_path, threads = job
+    start = time.time()
+    ok = merge_audio_video(background_path, audio_path, output_path, threads=threads)
+    return ok, time.time() - start
+
+def load_backgrounds(background_folder):
+    """배경 동영상 목록 (캐시를 쓰면 변환된 조각 폴더 목록)"""
     video_extensions = ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv')
     background_videos = [
         os.path.join(background_folder, f)
@@ -56,23 +280,72 @@ def batch_merge(tts_folder, output_folder, background_folder):
     if not background_videos:
         raise ValueError("배경 동영상이 없는 폴더입니다. 동영상을 추가해주세요.")
     
-    success = 0
-    fail = 0
+    # 배경을 미리 표준 형식으로 변환해 두면 합성 시 재인코딩 없이 이어 붙이기만 함
+    if USE_BACKGROUND_CACHE and MERGE_BACKEND != 'moviepy' and ffmpeg_available():
+        background_videos = prepare_backgrounds(background_videos)
+    return background_videos
+
+def batch_merge(tts_folder, output_folder, background_folder, workers=MERGE_WORKERS, threads=ENCODE_THREADS):
+    """폴더 내 모든 MP3 파일 처리"""
+    os.makedirs(output_folder, exist_ok=True)
+    background_videos = load_backgrounds(background_folder)
     
-    for filename in os.listdir(tts_folder):
+    workers, threads = plan_workers(workers, threads)
+    print(f"동시 합성 {workers}개, 인코딩당 스레드 {threads}개")
+    
+    jobs = []
+    for filename in sorted(os.listdir(tts_folder)):
         if filename.endswith(".mp3"):
             audio_path = os.path.join(tts_folder, filename)
             output_path = os.path.join(output_folder, f"{filename[:-4]}.mp4")
             
             # 랜덤 배경 동영상 선택
             random_bg = random.choice(background_videos)
-            
-            if merge_audio_video(random_bg, audio_path, output_path):
-                print(f"Created: {output_path} (사용된 배경: {os.path.basename(random_bg)})")
-                success += 1
-            else:
-                fail += 1
+            jobs.append((random_bg, audio_path, output_path, threads))
+    
+    success = 0
+    fail = 0
+    timings = []
+    batch_start = time.time()
+    
+    def on_result(job, ok, elapsed):
+        nonlocal success, fail
+        random_bg, _, output_path, _ = job
+        timings.append((os.path.basename(output_path), ok, elapsed))
+        if ok:
+            print(f"Created: {output_path} (사용된 배경: {background_name(random_bg)}, {elapsed:.1f}초)")
+            success += 1
+        else:
+            fail += 1
+    
+    if workers > 1 and len(jobs) > 1:
+        # 워커를 주기적으로 교체해 클립 리더/메모리가 누적되지 않도록 함
+        pool_options = {}
+        if sys.version_info >= (3, 11):
+            pool_options['max_tasks_per_child'] = MERGE_TASKS_PER_CHILD
+        with ProcessPoolExecutor(max_workers=workers, **pool_options) as executor:
+            futures = {executor.submit(_merge_job, job): job for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    ok, elapsed = future.result()
+                except Exception as e:
+                    print(f"Error Details: {str(e)}")
+                    ok, elapsed = False, 0.0
+                on_result(futures[future], ok, elapsed)
+    else:
+        for job in jobs:
+            on_result(job, *_merge_job(job))
+    
+    # 항목별 소요 시간 요약
+    wall_time = time.time() - batch_start
+    if timings:
+        print("\n항목별 소요 시간:")
+        for name, ok, elapsed in sorted(timings, key=lambda item: -item[2]):
+            print(f"  {'성공' if ok else '실패'} {elapsed:7.1f}초  {name}")
+        busy = sum(elapsed for _, _, elapsed in timings)
+        print(f"전체 {wall_time:.1f}초 (항목 합계 {busy:.1f}초, 평균 {busy / len(timings):.1f}초/건)")
                 
+    metrics.export()
     print(f"\n처리 완료: {success}개 성공, {fail}개 실패")
 
 if __name__ == "__main__":
@@ -1,7 +1,136 @@
 import os
 import re
+import json
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
+import soundfile
 from melo.api import TTS
+import store
+from timings import split_sentences, timings_path
+import metrics
+
+# TTS 설정
+TTS_LANGUAGE = 'KR'
+TTS_SPEAKER = 'KR'
+TTS_SPEED = 1.6
+TTS_DEVICE = 'auto'   # 'cpu', 'cuda', 'cuda:0', 'mps', 'auto' (auto: GPU가 없으면 CPU)
+TTS_WORKERS = 1       # 동시 합성 프로세스 수 (프로세스마다 모델을 하나씩 로드)
+
+# 문장 단위 합성 설정
+TTS_CHUNKED = True        # 문장별로 나눠 합성하고 캐시
+TTS_CHUNK_WORKERS = 2     # 한 글 안에서 동시에 합성할 문장 수
+TTS_PAUSE_MS = 250        # 문장 사이 무음 길이
+TTS_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_cache")
+
+class TTSEngine:
+    """MeloTTS 모델을 한 번만 로드해 재사용하는 합성기"""
+    def __init__(self, language=TTS_LANGUAGE, speaker=TTS_SPEAKER, device=TTS_DEVICE):
+        self.language = language
+        self.speaker = speaker
+        with metrics.stage('tts_model_load', device=device):
+            self.model = TTS(language=language, device=device)
+        self.device = getattr(self.model, 'device', device)
+        self.speaker_id = self.model.hps.data.spk2id[speaker]
+        self.sampling_rate = self.model.hps.data.sampling_rate
+
+    def synthesize(self, text, output_path, speed=TTS_SPEED):
+        self.model.tts_to_file(text, self.speaker_id, output_path, speed=speed)
+        return output_path
+
+    def sentence_audio(self, sentence, speed=TTS_SPEED):
+        """문장 하나의 오디오 (텍스트/화자/속도 해시로 캐시) - (오디오, 캐시 사용 여부) 반환"""
+        key = hashlib.sha256(f"{self.language}|{self.speaker}|{speed}|{sentence}".encode('utf-8')).hexdigest()
+        cache_path = os.path.join(TTS_CACHE_DIR, key[:2], f"{key}.npy")
+        if os.path.exists(cache_path):
+            return np.load(cache_path), True
+
+        audio = np.asarray(self.model.tts_to_file(sentence, self.speaker_id, None, speed=speed), dtype=np.float32)
+
+        # 동시에 같은 문장을 쓰더라도 깨진 파일이 남지 않도록 임시 파일 후 교체
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, audio)
+        os.replace(tmp_path, cache_path)
+        return audio, False
+
+    def synthesize_chunked(self, text, output_path, speed=TTS_SPEED, pause_ms=TTS_PAUSE_MS, chunk_workers=TTS_CHUNK_WORKERS):
+        """문장별 병렬 합성 후 무음을 넣어 하나의 파일로 합침 - 문장 목록과 길이(초) 반환"""
+        sentences = split_sentences(text)
+        with ThreadPoolExecutor(max_workers=max(1, chunk_workers)) as executor:
+            results = list(executor.map(lambda sentence: self.sentence_audio(sentence, speed), sentences))
+
+        pause = np.zeros(int(self.sampling_rate * pause_ms / 1000), dtype=np.float32)
+        pieces = []
+        durations = []
+        for i, (audio, _) in enumerate(results):
+            if i > 0:
+                pieces.append(pause)
+            pieces.append(audio)
+            durations.append(len(audio) / self.sampling_rate)
+        soundfile.write(output_path, np.concatenate(pieces), self.sampling_rate)
+
+        cached = sum(1 for _, hit in results if hit)
+        print(f"문장 {len(sentences)}개 합성 (캐시 사용 {cached}개): {os.path.basename(output_path)}")
+        return sentences, durations
+
+def write_timings(audio_path, text, sentences=None, durations=None, pause_ms=TTS_PAUSE_MS):
+    """문장 길이와 무음 길이로 문장별 시작/끝 시간을 계산해 저장 (Whisper 결과와 같은 segments 형식)"""
+    segments = []
+    position = 0.0
+    for sentence, duration in zip(sentences or [], durations or []):
+        segments.append({
+            'start': round(position, 3),
+            'end': round(position + duration, 3),
+            'text': sentence
+        })
+        position += duration + pause_ms / 1000
+
+    path = timings_path(audio_path)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'audio': os.path.basename(audio_path),
+            'text': text,
+            'segments': segments
+        }, f, ensure_ascii=False, indent=2)
+    return path
+
+def synthesize_article(engine, text, output_path):
+    with metrics.stage('tts', chunked=TTS_CHUNKED, chars=len(text)) as m:
+        if TTS_CHUNKED:
+            sentences, durations = engine.synthesize_chunked(text, output_path)
+            write_timings(output_path, text, sentences, durations)
+        else:
+            # 통째로 합성하면 문장 시간을 알 수 없으므로 원문만 기록
+            engine.synthesize(text, output_path)
+            write_timings(output_path, text)
+        m['audio_seconds'] = soundfile.info(output_path).duration
+    return output_path
+
+_engine = None
+
+def get_engine(device=TTS_DEVICE):
+    """프로세스당 하나의 합성기"""
+    global _engine
+    if _engine is None:
+        _engine = TTSEngine(device=device)
+        print(f"TTS 모델 로드 완료 (device: {_engine.device}, pid: {os.getpid()})")
+    return _engine
+
+def _init_worker(device, torch_threads):
+    # CPU 합성 시 워커끼리 코어를 나눠 씀
+    import torch
+    torch.set_num_threads(torch_threads)
+    get_engine(device)
+
+def _synthesize_job(job):
+    index, text, output_path = job
+    synthesize_article(get_engine(), text, output_path)
+    return index, output_path
 
 def preprocess_text(text):
     # 반복 이모티콘 변환 규칙
@@ -29,8 +158,14 @@ def sanitize_filename(title):
     filename = filename.replace(' ', '_')[:50]
     return filename
 
-def text_to_mp3(excel_path, output_folder='tts_output'):
-    df = pd.read_excel(excel_path, engine='openpyxl')
+def text_to_mp3(excel_path=None, output_folder='tts_output', db_path=store.DB_PATH, workers=TTS_WORKERS, device=TTS_DEVICE):
+    # 엑셀 경로가 없으면 저장소에서 TTS 대기 중인 글만 처리
+    conn = None
+    if excel_path:
+        df = pd.read_excel(excel_path, engine='openpyxl')
+    else:
+        conn = store.connect(db_path)
+        df = store.pending(conn, 'tts')
     script_dir = os.path.dirname(os.path.abspath(__file__))
     output_folder = os.path.join(script_dir, output_folder)
     os.makedirs(output_folder, exist_ok=True)
@@ -38,42 +173,72 @@ def text_to_mp3(excel_path, output_folder='tts_output'):
     success = 0
     fail = 0
     
+    # 합성할 작업 목록 (전처리/유효성 검사는 메인 프로세스에서)
+    jobs = []
     for index, row in df.iterrows():
-        try:
-            # 원본 텍스트
-            raw_text = str(row['generated_text'])
-            title = str(row['title'])
-            
-            # 전처리 적용
-            processed_text = preprocess_text(raw_text)
-            
-            # 유효성 검사
-            if len(processed_text.strip()) < 10:
-                print(f"[{index}] Skip - Content too short")
-                fail += 1
-                continue
-                
-            # 파일명 생성
-            clean_title = sanitize_filename(title)
-            filename = f"{index:03d}_{clean_title}.mp3"
-            output_path = os.path.join(output_folder, filename)
+        # 원본 텍스트
+        raw_text = str(row['generated_text'])
+        title = str(row['title'])
+        
+        # 전처리 적용
+        processed_text = preprocess_text(raw_text)
+        
+        # 유효성 검사
+        if len(processed_text.strip()) < 10:
+            print(f"[{index}] Skip - Content too short")
+            if conn is not None:
+                store.update_stage(conn, index, 'tts', store.SKIPPED)
+            fail += 1
+            continue
             
-            # TTS 변환
-            # You can set it manually to 'cpu' or 'cuda' 'cuda:0' 'mps' 'auto'
-            model = TTS(language='KR', device='cuda:0')
-            speaker_id = model.hps.data.spk2id['KR']
-            model.tts_to_file(processed_text, speaker_id, output_path, speed=1.6)
-
-            print(f"[{index}] Saved: {filename}")
+        # 파일명 생성
+        clean_title = sanitize_filename(title)
+        filename = f"{index:03d}_{clean_title}.mp3"
+        jobs.append((index, processed_text, os.path.join(output_folder, filename)))
+    
+    def on_result(index, output_path, error=None):
+        nonlocal success, fail
+        if error is None:
+            if conn is not None:
+                store.update_stage(conn, index, 'tts', store.DONE, audio_path=output_path)
+            print(f"[{index}] Saved: {os.path.basename(output_path)}")
             success += 1
-            
-        except Exception as e:
-            print(f"[{index}] Error: {str(e)}")
+        else:
+            print(f"[{index}] Error: {str(error)}")
+            if conn is not None:
+                store.update_stage(conn, index, 'tts', store.FAILED)
             fail += 1
+    
+    if jobs and workers > 1:
+        # 워커 프로세스마다 모델을 한 번 로드 (CUDA 안전을 위해 spawn)
+        torch_threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(device, torch_threads)
+        ) as executor:
+            futures = {executor.submit(_synthesize_job, job): job for job in jobs}
+            for future in as_completed(futures):
+                index, _, output_path = futures[future]
+                try:
+                    future.result()
+                    on_result(index, output_path)
+                except Exception as e:
+                    on_result(index, output_path, e)
+    elif jobs:
+        engine = get_engine(device)
+        for index, processed_text, output_path in jobs:
+            try:
+                synthesize_article(engine, processed_text, output_path)
+                on_result(index, output_path)
+            except Exception as e:
+                on_result(index, output_path, e)
             
+    if conn is not None:
+        conn.close()
+    metrics.export()
     print(f"\n변환 완료: {success}개 성공, {fail}개 실패")
 
 if __name__ == "__main__":
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    excel_file = os.path.join(script_dir, "teamblind_articles_processed.xlsx")
-    text_to_mp3(excel_file, "blind_tts")
\ No newline at end of file
+    text_to_mp3(output_folder="blind_tts")
\ No newline at end of file
@@ -1,12 +1,24 @@
 import os
+import json
 import time
+import random
+import socket
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse, urlunparse
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import httplib2
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.errors import HttpError
-from moviepy.editor import VideoFileClip
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+import media
+import metrics
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 # 설정값
@@ -18,8 +30,27 @@ API_VERSION = "v3"
 
 UPLOAD_FOLDER = os.path.join(script_dir, "output_videos")  # 업로드 대상 폴더
 UPLOADED_FOLDER = os.path.join(script_dir, "trash")  # 업로드 완료 폴더
-WAIT_SECONDS = 60  # 동영상 간 업로드 대기 시간
-MAX_RETRIES = 3  # 업로드 실패 시 최대 재시도 횟수
+MAX_RETRIES = 3  # 일시적 오류 시 같은 위치부터 이어 올리는 최대 재시도 횟수
+RETRY_BASE_SECONDS = 2  # 재시도 대기 시간 (2, 4, 8초 ... + 임의 지연)
+RETRIABLE_STATUS_CODES = (500, 502, 503, 504)
+RETRIABLE_EXCEPTIONS = (httplib2.HttpLib2Error, ConnectionError, socket.timeout)
+
+# 업로드 스케줄러 설정
+UPLOAD_WORKERS = 3  # 동시 업로드 수
+CHUNK_SIZE = 8 * 1024 * 1024  # 재개 가능 업로드 조각 크기 (256KB의 배수)
+UPLOAD_API_ENDPOINT = None  # 테스트용 가짜 업로드 서버 주소 (예: "http://localhost:8080/")
+
+# 일일 API 할당량 (태평양 시간 자정에 초기화)
+QUOTA_FILE = os.path.join(script_dir, "youtube_quota.json")
+DAILY_QUOTA = 10000
+UPLOAD_COST = 1600  # videos.insert 1회 비용
+QUOTA_ERRORS = ('quotaExceeded', 'uploadLimitExceeded', 'dailyLimitExceeded')
+try:
+    PACIFIC = ZoneInfo("America/Los_Angeles")
+except ZoneInfoNotFoundError:  # tzdata가 없는 Windows에서는 PST 고정
+    PACIFIC = timezone(timedelta(hours=-8))
+MIN_DURATION = 10
+MAX_DURATION = 180
 
 
 def get_video_files(folder_path):
@@ -37,28 +68,93 @@ def move_uploaded_file(filename):
     os.rename(src, dst)
 
 def validate_shorts(video_path):
-    """쇼츠 요구사항 검증"""
-    clip = VideoFileClip(video_path)
-
-    # 길이 검사 (10초 이상)
-    if clip.duration < 10:
-        clip.close()
-        raise ValueError(f"{os.path.basename(video_path)}: 10초 미만")
-
-    # 길이 검사 (180초 이하)
-    if clip.duration > 180:
-        clip.close()
-        raise ValueError(f"{os.path.basename(video_path)}: 180초 초과")
+    """쇼츠 요구사항 검증 (ffprobe 정보만 사용, 클립을 열지 않음)"""
+    info = media.probe(video_path)
+    name = os.path.basename(video_path)
+
+    # 길이 검사 (10초 이상, 180초 이하)
+    if info['duration'] < MIN_DURATION:
+        raise ValueError(f"{name}: {MIN_DURATION}초 미만")
+    if info['duration'] > MAX_DURATION:
+        raise ValueError(f"{name}: {MAX_DURATION}초 초과")
     
-    # 화면 비율 검사 (세로 방향 9:16)
-    w, h = clip.size
-    if w/h > 0.75:  # 가로가 세로의 75% 이상이면 경고
-        print(f"[경고] {os.path.basename(video_path)}: 세로 화면 비율 권장(9:16)")
+    if not info['width'] or not info['height']:
+        raise ValueError(f"{name}: 비디오 스트림 없음")
     
-    clip.close()
+    # 화면 비율 검사 (세로 방향 9:16)
+    if info['width'] / info['height'] > 0.75:  # 가로가 세로의 75% 이상이면 경고
+        print(f"[경고] {name}: 세로 화면 비율 권장(9:16)")
+
+class QuotaExceeded(Exception):
+    """API가 일일 할당량 초과로 요청을 거절함"""
+
+class QuotaTracker:
+    """태평양 시간 기준 일일 사용량을 파일에 기록하고, 남은 만큼만 업로드를 허용"""
+    def __init__(self, path=QUOTA_FILE, daily_quota=DAILY_QUOTA):
+        self.path = path
+        self.daily_quota = daily_quota
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def today():
+        return datetime.now(PACIFIC).strftime('%Y-%m-%d')
+
+    def _load(self):
+        state = {'date': self.today(), 'used': 0}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('date') == state['date']:
+                state = saved
+        return state
+
+    def _save(self, state):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
 
-def upload_short(youtube, video_path, title, description):
-    """동영상 업로드 함수"""
+    def remaining(self):
+        with self._lock:
+            return self.daily_quota - self._load()['used']
+
+    def try_reserve(self, cost):
+        with self._lock:
+            state = self._load()
+            if state['used'] + cost > self.daily_quota:
+                return False
+            state['used'] += cost
+            self._save(state)
+            return True
+
+    def exhaust(self):
+        """API가 할당량 초과를 알리면 오늘 남은 할당량을 0으로 맞춤"""
+        with self._lock:
+            state = self._load()
+            state['used'] = max(state['used'], self.daily_quota)
+            self._save(state)
+
+    def seconds_until_reset(self):
+        now = datetime.now(PACIFIC)
+        midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (midnight - now).total_seconds()
+
+    def reserve(self, cost, wait=True):
+        """할당량을 예약 (부족하면 wait=True일 때 초기화 시각까지 기다림)"""
+        while not self.try_reserve(cost):
+            if not wait:
+                return False
+            delay = self.seconds_until_reset() + 60
+            print(f"API 할당량 소진, {delay / 3600:.1f}시간 후 재개")
+            time.sleep(delay)
+        return True
+
+def _is_quota_error(error):
+    content = error.content.decode('utf-8', errors='ignore') if isinstance(error.content, bytes) else str(error.content)
+    return error.resp.status in (403, 429) and any(reason in content for reason in QUOTA_ERRORS)
+
+def upload_short(youtube, video_path, title, description, chunksize=CHUNK_SIZE, max_retries=MAX_RETRIES):
+    """동영상 업로드 함수 (일시적 오류는 마지막으로 받은 위치부터 이어서 재시도)"""
     body = {
         "snippet": {
             "title": title,
@@ -71,22 +167,96 @@ def upload_short(youtube, video_path, title, description):
         }
     }
 
-    media = MediaFileUpload(video_path, mimetype="video/*", resumable=True)
+    with metrics.stage('upload', bytes=os.path.getsize(video_path), chunksize=chunksize) as m:
+        response = _send(youtube, video_path, body, chunksize, max_retries, m)
+    return response['id']
+
+def _send(youtube, video_path, body, chunksize, max_retries, stats):
+    media = MediaFileUpload(video_path, mimetype="video/*", chunksize=chunksize, resumable=True)
     request = youtube.videos().insert(part="snippet,status", body=body, media_body=media)
     
     response = None
+    retry = 0
+    stats['retries'] = 0
     while response is None:
         try:
             status, response = request.next_chunk()
             if status:
-                print(f"진행률: {int(status.progress() * 100)}%")
+                print(f"{os.path.basename(video_path)} 진행률: {int(status.progress() * 100)}%")
+            retry = 0
         except HttpError as e:
-            print(f"업로드 오류: {e}")
-            raise
+            if _is_quota_error(e):
+                raise QuotaExceeded(str(e))
+            if e.resp.status not in RETRIABLE_STATUS_CODES or retry >= max_retries:
+                print(f"업로드 오류: {e}")
+                raise
+            error = e
+        except RETRIABLE_EXCEPTIONS as e:
+            if retry >= max_retries:
+                print(f"업로드 오류: {e}")
+                raise
+            error = e
+        else:
+            continue
+        
+        # 같은 request로 next_chunk를 다시 부르면 서버가 받은 위치부터 이어서 전송
+        retry += 1
+        stats['retries'] += 1
+        delay = RETRY_BASE_SECONDS * 2 ** (retry - 1) + random.random()
+        print(f"일시적 오류 ({error}), {delay:.1f}초 후 재시도 {retry}/{max_retries}")
+        time.sleep(delay)
 
-    return response['id']
+    return response
+
+def make_metadata(filename):
+    # 메타데이터 생성 (파일명에서 번호 접두어와 확장자 제거)
+    base_name = os.path.splitext(filename)[0].split('_', 1)[-1]
+    clean_title = base_name.replace('_', ' ') 
+    title = f"{clean_title} 쇼츠"
+    description = f"{clean_title} \n#shorts"
+    return title, description
+
+def upload_all(filenames, service_factory, quota=None, workers=UPLOAD_WORKERS, chunksize=CHUNK_SIZE, wait_for_quota=True):
+    """여러 동영상을 동시에 업로드 - 할당량이 허용하는 만큼 바로 보내고, 소진되면 초기화까지 대기"""
+    quota = quota or QuotaTracker()
+    local = threading.local()  # API 클라이언트(httplib2)는 스레드 간 공유 불가 → 스레드마다 생성
+    
+    def upload_one(filename):
+        video_path = os.path.join(UPLOAD_FOLDER, filename)
+        validate_shorts(video_path)
+        title, description = make_metadata(filename)
+        
+        while True:
+            if not quota.reserve(UPLOAD_COST, wait=wait_for_quota):
+                raise QuotaExceeded("오늘 남은 API 할당량이 없습니다.")
+            if not hasattr(local, 'youtube'):
+                local.youtube = service_factory()
+            try:
+                video_id = upload_short(local.youtube, video_path, title, description, chunksize)
+                break
+            except QuotaExceeded:
+                quota.exhaust()
+                if not wait_for_quota:
+                    raise
+        
+        move_uploaded_file(filename)
+        return video_id
+    
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(upload_one, filename): filename for filename in filenames}
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                results[filename] = future.result()
+                print(f"성공! {filename} 동영상 ID: {results[filename]}")
+            except Exception as e:
+                results[filename] = None
+                print(f"업로드 실패: {filename}: {str(e)}")
+    metrics.export()
+    return results
 
-def get_authenticated_service():
+def get_credentials():
     creds = None
     # 토큰 파일이 존재하면 재사용
     if os.path.exists(TOKEN_FILE):
@@ -103,14 +273,49 @@ def get_authenticated_service():
             creds = flow.run_local_server(port=0)
         
         # 새 토큰 저장
-        with open("token.json", "w") as token:
+        with open(TOKEN_FILE, "w") as token:
             token.write(creds.to_json())
 
-    return build(API_SERVICE_NAME, API_VERSION, credentials=creds)
+    return creds
+
+class _EndpointHttp(httplib2.Http):
+    # 업로드 주소는 api_endpoint로 호스트만 바뀌고 https가 그대로라 http 테스트 서버에 맞게 scheme도 바꿈
+    def __init__(self, api_endpoint, timeout=60):
+        super().__init__(timeout=timeout)
+        self.redirect_codes = self.redirect_codes - {308}  # 308은 재개 가능 업로드의 "이어서 전송" 응답
+        self.endpoint = urlparse(api_endpoint)
+
+    def request(self, uri, *args, **kwargs):
+        parsed = urlparse(uri)
+        if parsed.netloc == self.endpoint.netloc and parsed.scheme != self.endpoint.scheme:
+            uri = urlunparse(parsed._replace(scheme=self.endpoint.scheme))
+        return super().request(uri, *args, **kwargs)
+
+def build_service(credentials=None, api_endpoint=UPLOAD_API_ENDPOINT):
+    """API 클라이언트 생성 (api_endpoint를 주면 해당 서버로 요청, credentials가 없으면 인증 없이)"""
+    if api_endpoint:
+        http = _EndpointHttp(api_endpoint)
+        if credentials is not None:
+            http = AuthorizedHttp(credentials, http=http)
+        return build(API_SERVICE_NAME, API_VERSION, http=http,
+                     client_options={'api_endpoint': api_endpoint})
+    return build(API_SERVICE_NAME, API_VERSION, credentials=credentials)
+
+def get_authenticated_service(api_endpoint=UPLOAD_API_ENDPOINT):
+    return build_service(None if api_endpoint else get_credentials(), api_endpoint)
+
+def make_service_factory(api_endpoint=UPLOAD_API_ENDPOINT):
+    """인증은 한 번만 하고, 호출할 때마다 새 API 클라이언트를 만드는 함수 반환"""
+    credentials = None if api_endpoint else get_credentials()
+    return lambda: build_service(credentials, api_endpoint)
 
 if __name__ == "__main__":
-    # YouTube API 인증
-    youtube = get_authenticated_service()
+    parser = argparse.ArgumentParser(description="유튜브 쇼츠 업로드")
+    parser.add_argument('--workers', type=int, default=UPLOAD_WORKERS, help="동시 업로드 수")
+    parser.add_argument('--chunk-mb', type=int, default=CHUNK_SIZE // (1024 * 1024), help="업로드 조각 크기 (MB)")
+    parser.add_argument('--api-endpoint', default=UPLOAD_API_ENDPOINT, help="가짜 업로드 서버 주소 (테스트용)")
+    parser.add_argument('--no-wait', action='store_true', help="할당량이 소진되면 기다리지 않고 종료")
+    args = parser.parse_args()
     
     # 대상 폴더 확인
     if not os.path.exists(UPLOAD_FOLDER):
@@ -119,34 +324,13 @@ if __name__ == "__main__":
     # 업로드 대상 파일 리스트
     video_files = get_video_files(UPLOAD_FOLDER)
     
-    for idx, filename in enumerate(video_files, 1):
-        video_path = os.path.join(UPLOAD_FOLDER, filename)
-        print(f"\n[{idx}/{len(video_files)}] {filename} 처리 시작")
-
-        try:
-            # 유효성 검사
-            #validate_shorts(video_path)
-            
-            # 메타데이터 생성 (파일명에서 확장자 제거)
-            base_name = os.path.splitext(filename[4:])[0]
-            clean_title = base_name.replace('_', ' ') 
-            title = f"{clean_title} 쇼츠"
-            description = f"{clean_title} \n#shorts"
-
-            # 업로드 실행
-            video_id = upload_short(youtube, video_path, title, description)
-            print(f"성공! 동영상 ID: {video_id}")
-            
-            # 파일 이동
-            move_uploaded_file(filename)
-            
-            # 다음 업로드 전 대기
-            if idx < len(video_files):
-                print(f"{WAIT_SECONDS}초 후 다음 동영상 업로드...")
-                time.sleep(WAIT_SECONDS)
-
-        except Exception as e:
-            print(f"업로드 실패: {str(e)}")
-            continue
+    # YouTube API 인증 (한 번만) 후 스레드마다 클라이언트 생성
+    quota = QuotaTracker()
+    print(f"업로드 대상 {len(video_files)}개, 오늘 남은 할당량 {quota.remaining()} (업로드당 {UPLOAD_COST})")
+    upload_all(
+        video_files, make_service_factory(args.api_endpoint), quota,
+        workers=args.workers, chunksize=args.chunk_mb * 1024 * 1024,
+        wait_for_quota=not args.no_wait
+    )
 
     print("\n모든 동영상 처리 완료!")
\ No newline at end of file